@@ -0,0 +1,248 @@
+"""
+Selectable embedding backends for jina-embeddings-v3.
+
+EMBEDDING_BACKEND picks one of:
+  torch      - SentenceTransformer in fp32 PyTorch (reference)
+  onnx       - the exported ONNX graph on ONNX Runtime
+  onnx-int8  - the same graph with int8 dynamic-quantized weights
+
+Run `python backends.py export` once to fetch the ONNX graph into ONNX_DIR and
+build the quantized copy, then `python backends.py parity --backend onnx-int8`
+to compare it against the PyTorch output before switching ingest over.
+
+The retriever imports this module for query embeddings (it runs with the
+repository on PYTHONPATH), so ingest and query vectors always share one
+loader, pooling and truncation.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+MODEL_NAME = "jinaai/jina-embeddings-v3"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+ONNX_DIR = os.environ.get("ONNX_DIR", "/app/src/models/jina-embeddings-v3-onnx")
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))  # 0 lets ONNX Runtime decide
+ONNX_MAX_LENGTH = int(os.environ.get("ONNX_MAX_LENGTH", "8192"))
+FULL_DIM = 1024
+MATRYOSHKA_DIMS = (32, 64, 128, 256, 512, 768, 1024)
+# Matryoshka output width stored in the collection; smaller means less memory and cheaper distances
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", str(FULL_DIM)))
+
+ONNX_FILES = {
+    "onnx": "model.onnx",
+    "onnx-int8": "model_int8.onnx",
+}
+PARITY_TEXTS = [
+    "What is the difference between a Roth IRA and a traditional IRA?",
+    "Box 12 code DD reports the cost of employer-sponsored health coverage.",
+    "FINRA BrokerCheck lets you research the background of brokers and firms.",
+    "If you cannot pay your credit card bill, contact your card issuer as soon as possible.",
+    "Form 8606 is used to report nondeductible contributions to traditional IRAs.",
+]
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name=MODEL_NAME, device="cpu", dim=None):
+        from sentence_transformers import SentenceTransformer
+
+        self.dim = dim
+        self.model = SentenceTransformer(model_name, device=device, trust_remote_code=True)
+
+    def encode(self, texts, task, batch_size=32):
+        emb = self.model.encode(texts, batch_size=batch_size, task=task, convert_to_numpy=True)
+        return truncate_embeddings(emb, self.dim)
+
+
+class OnnxBackend:
+    """Runs the ONNX export with mean pooling and L2 normalisation, as the PyTorch model does."""
+
+    def __init__(self, model_path, name="onnx", model_name=MODEL_NAME,
+                 max_length=ONNX_MAX_LENGTH, threads=ONNX_THREADS, dim=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer, PretrainedConfig
+
+        self.name = name
+        self.dim = dim
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.tasks = list(PretrainedConfig.from_pretrained(model_name).lora_adaptations)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    def encode(self, texts, task, batch_size=32):
+        if isinstance(texts, str):
+            texts = [texts]
+        task_id = np.array(self.tasks.index(task), dtype=np.int64)
+
+        # Sort by length so each batch pads to similar sizes, then restore input order
+        order = np.argsort([len(t) for t in texts])
+        out = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            tokens = self.tokenizer(
+                [texts[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            hidden = self.session.run(None, {
+                "input_ids": tokens["input_ids"].astype(np.int64),
+                "attention_mask": tokens["attention_mask"].astype(np.int64),
+                "task_id": task_id,
+            })[0]
+            for i, emb in zip(idx, _mean_pool(hidden, tokens["attention_mask"])):
+                out[i] = emb
+        if not out:
+            return np.zeros((0, self.dim or FULL_DIM), dtype=np.float32)
+        return truncate_embeddings(np.vstack(out), self.dim)
+
+
+def _mean_pool(hidden, attention_mask):
+    mask = attention_mask[..., None].astype(hidden.dtype)
+    summed = (hidden * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+
+def truncate_embeddings(embeddings, dim):
+    """Matryoshka truncation: keep the leading `dim` components and re-normalise."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dim is None or embeddings.shape[-1] == dim:
+        return embeddings
+    if dim > embeddings.shape[-1]:
+        raise ValueError(f"Cannot truncate {embeddings.shape[-1]}-d embeddings to {dim}")
+    out = embeddings[..., :dim]
+    return out / np.clip(np.linalg.norm(out, axis=-1, keepdims=True), 1e-12, None)
+
+
+def validate_dim(dim):
+    if dim not in MATRYOSHKA_DIMS:
+        raise ValueError(f"EMBEDDING_DIM must be one of {MATRYOSHKA_DIMS}, got {dim}")
+    return dim
+
+
+def collection_dim(collection):
+    """Embedding width recorded on a collection, or read off a stored vector for older collections."""
+    stored = (collection.metadata or {}).get("embedding_dim")
+    if stored is not None:
+        return int(stored)
+    if collection.count() > 0:
+        sample = collection.peek(1).get("embeddings")
+        if sample is not None and len(sample):
+            return len(sample[0])
+    return None
+
+
+def ensure_collection_dim(collection, dim):
+    """Record `dim` on the collection, refusing to add vectors of a different width."""
+    stored = collection_dim(collection)
+    if stored is not None and stored != dim:
+        raise ValueError(
+            f"Collection '{collection.name}' holds {stored}-d embeddings; refusing to mix in {dim}-d. "
+            f"Set EMBEDDING_DIM={stored} or rebuild the collection."
+        )
+    metadata = collection.metadata or {}
+    if metadata.get("embedding_dim") != dim:
+        # HNSW settings cannot be changed after creation, so only carry the plain keys over
+        updated = {k: v for k, v in metadata.items() if not k.startswith("hnsw:")}
+        updated["embedding_dim"] = dim
+        collection.modify(metadata=updated)
+
+
+def load_backend(name=None, onnx_dir=ONNX_DIR, dim=None):
+    name = name or EMBEDDING_BACKEND
+    logging.info(f"Loading {MODEL_NAME} with '{name}' backend, dim={dim or FULL_DIM}")
+    if name == "torch":
+        return TorchBackend(dim=dim)
+    if name in ONNX_FILES:
+        path = os.path.join(onnx_dir, ONNX_FILES[name])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run `python backends.py export` first")
+        return OnnxBackend(path, name=name, dim=dim)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{name}'; expected torch, {', '.join(ONNX_FILES)}")
+
+
+def export_onnx(out_dir=ONNX_DIR):
+    """Fetch the published ONNX graph for the model and write an int8 dynamic-quantized copy."""
+    from huggingface_hub import hf_hub_download
+    from huggingface_hub.utils import EntryNotFoundError
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(out_dir, exist_ok=True)
+    fp32_path = hf_hub_download(MODEL_NAME, "onnx/model.onnx", local_dir=out_dir)
+    try:
+        # Graphs over 2GB keep their weights in a sidecar file next to model.onnx
+        hf_hub_download(MODEL_NAME, "onnx/model.onnx_data", local_dir=out_dir)
+    except EntryNotFoundError:
+        pass
+    model_path = os.path.join(out_dir, ONNX_FILES["onnx"])
+    if os.path.abspath(fp32_path) != os.path.abspath(model_path):
+        for suffix in ("", "_data"):
+            if os.path.exists(fp32_path + suffix):
+                os.replace(fp32_path + suffix, model_path + suffix)
+    logging.info(f"ONNX graph at {model_path}")
+
+    int8_path = os.path.join(out_dir, ONNX_FILES["onnx-int8"])
+    quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+    logging.info(f"Quantized int8 graph at {int8_path}")
+    return model_path, int8_path
+
+
+def parity_check(candidate, reference, texts=PARITY_TEXTS, task="retrieval.passage"):
+    """Cosine similarity between candidate and reference embeddings of the same texts."""
+    timings = {}
+    start = time.perf_counter()
+    ref = np.asarray(reference.encode(texts, task=task), dtype=np.float32)
+    timings[reference.name] = time.perf_counter() - start
+    start = time.perf_counter()
+    cand = np.asarray(candidate.encode(texts, task=task), dtype=np.float32)
+    timings[candidate.name] = time.perf_counter() - start
+
+    ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+    cand /= np.linalg.norm(cand, axis=1, keepdims=True)
+    cosine = (ref * cand).sum(axis=1)
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "seconds": timings,
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export and validate embedding backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Fetch the ONNX graph and build the int8 copy")
+    export.add_argument("--out", default=ONNX_DIR)
+
+    parity = sub.add_parser("parity", help="Compare a backend against PyTorch")
+    parity.add_argument("--backend", default="onnx-int8", choices=list(ONNX_FILES))
+    parity.add_argument("--onnx-dir", default=ONNX_DIR)
+    parity.add_argument("--min-cosine", type=float, default=0.98)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_onnx(args.out)
+        return
+
+    report = parity_check(load_backend(args.backend, args.onnx_dir), load_backend("torch"))
+    logging.info(f"Parity {args.backend} vs torch: {report}")
+    if report["min_cosine"] < args.min_cosine:
+        logging.error(f"min cosine {report['min_cosine']:.4f} below {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
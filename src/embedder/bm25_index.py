@@ -0,0 +1,144 @@
+"""
+Builds the compact on-disk BM25 index the retriever fuses with dense results.
+
+Layout of an index directory:
+  meta.json    k1, b, avgdl, document count and the authority/doctype code tables
+  terms.json   vocabulary; a term's position is its id
+  ids.json     chunk ids; a chunk's position is its document number
+  index.npz    CSR postings (offsets, doc, precomputed BM25 weight) plus
+               per-document authority/doctype codes and year for filtering
+
+Per-posting weights are precomputed at build time, so a query is a handful of
+vectorised scatter-adds. src/retriever/bm25.py imports tokenize from here
+so queries are tokenized exactly as the index was.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+from collections import Counter
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it of on or that the this to what when where which who why "
+    "with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Builder:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.doc_len = []
+        self.authority = []
+        self.doctype = []
+        self.year = []
+        self._postings = {}
+        self._authorities = {}
+        self._doctypes = {}
+
+    def add(self, ids, texts, metadatas):
+        for chunk_id, text, meta in zip(ids, texts, metadatas):
+            meta = meta or {}
+            doc = len(self.ids)
+            tokens = tokenize(text)
+            self.ids.append(chunk_id)
+            self.doc_len.append(len(tokens))
+            self.authority.append(self._authorities.setdefault(meta.get("authority") or "N/A", len(self._authorities)))
+            self.doctype.append(self._doctypes.setdefault(meta.get("doctype") or "N/A", len(self._doctypes)))
+            self.year.append(int(meta.get("year", -1) if meta.get("year") is not None else -1))
+            for term, tf in Counter(tokens).items():
+                self._postings.setdefault(term, []).append((doc, tf))
+
+    def save(self, path):
+        n_docs = len(self.ids)
+        doc_len = np.asarray(self.doc_len, dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+        norm = self.k1 * (1 - self.b + self.b * doc_len / max(avgdl, 1e-9))
+
+        terms = sorted(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        docs, weights = [], []
+        for t, term in enumerate(terms):
+            postings = self._postings[term]
+            d = np.fromiter((p[0] for p in postings), dtype=np.int32, count=len(postings))
+            tf = np.fromiter((p[1] for p in postings), dtype=np.float32, count=len(postings))
+            idf = np.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            docs.append(d)
+            weights.append((idf * tf * (self.k1 + 1) / (tf + norm[d])).astype(np.float32))
+            offsets[t + 1] = offsets[t] + len(postings)
+
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.savez(
+            os.path.join(tmp, "index.npz"),
+            offsets=offsets,
+            docs=np.concatenate(docs) if docs else np.zeros(0, dtype=np.int32),
+            weights=np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+            authority=np.asarray(self.authority, dtype=np.int16),
+            doctype=np.asarray(self.doctype, dtype=np.int16),
+            year=np.asarray(self.year, dtype=np.int32),
+        )
+        _write_json(os.path.join(tmp, "terms.json"), terms)
+        _write_json(os.path.join(tmp, "ids.json"), self.ids)
+        _write_json(os.path.join(tmp, "meta.json"), {
+            "k1": self.k1,
+            "b": self.b,
+            "avgdl": avgdl,
+            "n_docs": n_docs,
+            "authorities": list(self._authorities),
+            "doctypes": list(self._doctypes),
+        })
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        logging.info(f"Wrote BM25 index over {n_docs} chunks and {len(terms)} terms to {path}")
+
+
+def _write_json(path, obj):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+
+
+def build_from_collection(collection, path, page_size=5000):
+    builder = BM25Builder()
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        if not page["ids"]:
+            break
+        builder.add(page["ids"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+    builder.save(path)
+
+
+def build_from_store(store_path, path):
+    from embedding_store import EmbeddingStore
+
+    builder = BM25Builder()
+    for _, chunks in EmbeddingStore(store_path).iter_shards():
+        rows = chunks.to_pylist()
+        builder.add(
+            [r.pop("id") for r in rows],
+            [r.pop("document") for r in rows],
+            rows,
+        )
+    builder.save(path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the BM25 index from an embedding store")
+    parser.add_argument("--store", default=os.environ.get("EMBEDDING_STORE_PATH", "/app/src/embedding_store"))
+    parser.add_argument("--out", default=os.environ.get("BM25_INDEX_PATH", "/app/src/bm25_index"))
+    args = parser.parse_args()
+    build_from_store(args.store, args.out)
@@ -0,0 +1,123 @@
+"""
+Token-budgeted, sentence-aware chunking of ingest records.
+
+Records produced by the IRS `chunk_blocks` and FINRA `h2_chunker` stages are
+already sized and aligned to document structure, so any record that fits the
+token budget is kept whole. Longer records (e.g. single-record CFPB pages)
+are split on paragraph and sentence boundaries, with an optional overlap of
+trailing sentences carried into the next chunk. Chunks never span records.
+"""
+import re
+import threading
+from collections import Counter
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+(?=[\"'(\[A-Z0-9•-])")
+_PARAGRAPH = re.compile(r"\n\s*\n|\n(?=\s*[•\-*]\s)")
+
+SIZE_BUCKETS = (32, 64, 128, 256, 512, 1024)
+
+
+def approx_token_count(text):
+    """Word-piece tokenizers emit roughly one token per word or punctuation mark."""
+    return len(_TOKEN.findall(text))
+
+
+def split_sentences(text):
+    sentences = []
+    for para in _PARAGRAPH.split(text):
+        para = para.strip()
+        if para:
+            sentences.extend(s.strip() for s in _SENTENCE_END.split(para) if s.strip())
+    return sentences
+
+
+def _split_long_sentence(sentence, max_tokens, count_tokens):
+    # Tokens never span whitespace, so a running per-word total stays linear on long unpunctuated
+    # text (tables, URL lists) instead of recounting the growing prefix for every word
+    pieces, buf, buf_tokens = [], [], 0
+    for word in sentence.split():
+        n = count_tokens(word)
+        if buf and buf_tokens + n > max_tokens:
+            pieces.append(" ".join(buf))
+            buf, buf_tokens = [], 0
+        buf.append(word)
+        buf_tokens += n
+    if buf:
+        pieces.append(" ".join(buf))
+    return pieces
+
+
+def chunk_text(text, max_tokens=512, overlap_tokens=32, count_tokens=approx_token_count):
+    """Split one record's text into chunks of at most `max_tokens` tokens."""
+    text = text.strip()
+    if not text:
+        return []
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    units = []
+    for sentence in split_sentences(text):
+        n = count_tokens(sentence)
+        if n > max_tokens:
+            units.extend((p, count_tokens(p)) for p in _split_long_sentence(sentence, max_tokens, count_tokens))
+        else:
+            units.append((sentence, n))
+
+    chunks, buf, buf_tokens = [], [], 0
+    for sentence, n in units:
+        if buf and buf_tokens + n > max_tokens:
+            chunks.append(" ".join(s for s, _ in buf))
+            # Carry whole trailing sentences into the next chunk as overlap
+            carry, carry_tokens = [], 0
+            for s, k in reversed(buf):
+                if carry_tokens + k > overlap_tokens or carry_tokens + k + n > max_tokens:
+                    break
+                carry.insert(0, (s, k))
+                carry_tokens += k
+            buf, buf_tokens = carry, carry_tokens
+        buf.append((sentence, n))
+        buf_tokens += n
+    if buf:
+        chunks.append(" ".join(s for s, _ in buf))
+    return chunks
+
+
+class ChunkStats:
+    """Thread-safe histogram of chunks per record and tokens per chunk."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = 0
+        self.chunks = 0
+        self.tokens = 0
+        self.per_record = Counter()
+        self.sizes = Counter()
+
+    def add(self, chunk_token_counts):
+        with self._lock:
+            self.records += 1
+            self.chunks += len(chunk_token_counts)
+            self.tokens += sum(chunk_token_counts)
+            self.per_record[len(chunk_token_counts)] += 1
+            for n in chunk_token_counts:
+                self.sizes[_bucket(n)] += 1
+
+    def report(self):
+        with self._lock:
+            mean = self.tokens / self.chunks if self.chunks else 0.0
+            lines = [f"{self.records} records -> {self.chunks} chunks, mean {mean:.0f} tokens/chunk"]
+            lines.append("tokens/chunk: " + ", ".join(f"{b}: {self.sizes[b]}" for b in _bucket_labels()))
+            lines.append("chunks/record: " + ", ".join(f"{k}: {v}" for k, v in sorted(self.per_record.items())))
+        return "\n".join(lines)
+
+
+def _bucket(n):
+    for upper in SIZE_BUCKETS:
+        if n <= upper:
+            return f"<={upper}"
+    return f">{SIZE_BUCKETS[-1]}"
+
+
+def _bucket_labels():
+    return [f"<={u}" for u in SIZE_BUCKETS] + [f">{SIZE_BUCKETS[-1]}"]
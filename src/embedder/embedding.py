@@ -1,13 +1,20 @@
 import os
 import json
+import time
+import argparse
 import gzip
 import logging
 from tqdm import tqdm
 from google.cloud import storage
-from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
 from dotenv import load_dotenv
+from backends import EMBEDDING_BACKEND, EMBEDDING_DIM, MODEL_NAME, ensure_collection_dim, load_backend, validate_dim
+from pipeline import IngestPipeline
+from ingest_state import IngestState
+from embedding_store import EmbeddingStoreWriter, export_collection
+from chunking import ChunkStats, approx_token_count, chunk_text
+from bm25_index import BM25Builder, build_from_collection
 
 load_dotenv()
 
@@ -16,10 +23,17 @@ logging.getLogger("sentence-transformers").setLevel(logging.WARNING)
 
 # Load environment variables
 BUCKET_NAME = os.environ.get("GCS_BUCKET")
+# Only blobs under this prefix are ingested (e.g. the near-dedup output); empty reads the whole bucket
+INGEST_PREFIX = os.environ.get("INGEST_PREFIX", "")
 KEY_PATH = os.environ.get("BUCKET_CREDENTIALS")
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = KEY_PATH
 CHROMA_PATH = "/app/src/chroma_storage"
 COLLECTION_NAME = "finwhiz_docs"
+INGEST_STATE_PATH = os.environ.get("INGEST_STATE_PATH", "/app/src/ingest_state.sqlite3")
+# float16 .npy shards + parquet rows that any index can be rebuilt from; empty disables
+EMBEDDING_STORE_PATH = os.environ.get("EMBEDDING_STORE_PATH", "/app/src/embedding_store")
+# Sparse keyword index over the same chunks, read by the retriever's hybrid search; empty disables
+BM25_INDEX_PATH = os.environ.get("BM25_INDEX_PATH", "/app/src/bm25_index")
 
 if not BUCKET_NAME or not KEY_PATH:
     raise ValueError("GCS_BUCKET and BUCKET_CREDENTIALS must be set in .env")
@@ -28,16 +42,19 @@ if not BUCKET_NAME or not KEY_PATH:
 chroma_client = chromadb.Client(Settings(persist_directory=CHROMA_PATH))
 
 collection = chroma_client.get_or_create_collection(COLLECTION_NAME)
+ensure_collection_dim(collection, validate_dim(EMBEDDING_DIM))
 
-# Load embedding model
-logging.info("Loading SentenceTransformer embedding model...")
-embedder = SentenceTransformer("jinaai/jina-embeddings-v3", trust_remote_code=True)
+# Load embedding model (EMBEDDING_BACKEND selects torch, onnx or onnx-int8)
+logging.info("Loading embedding model...")
+embedder = load_backend(dim=EMBEDDING_DIM)
 BATCH_SIZE = 64  # batch size for embedding
+INGEST_READERS = int(os.environ.get("INGEST_READERS", "4"))  # concurrent blob downloads
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "8"))  # batches buffered between stages
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "512"))  # records under this stay whole
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+chunk_stats = ChunkStats()
 
 # Utility functions
-def chunk_text(text, max_chars=500):
-    return [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
-
 def clean_metadata(meta: dict) -> dict:
     return {
         "title": meta.get("title") or "N/A",
@@ -48,34 +65,35 @@ def clean_metadata(meta: dict) -> dict:
     }
 
 def embed_texts(texts):
-    return embedder.encode(texts, batch_size=32, task="retrieval.passage", convert_to_numpy=True).tolist()
-
-def store_records(records, collection):
-    if not records:
-        return 0
+    return embedder.encode(texts, task="retrieval.passage", batch_size=32).tolist()
 
+def prepare_records(records):
     texts, ids, metadatas = [], [], []
 
     for rec in records:
         if not rec.get("text"):
             continue
-        chunks = chunk_text(rec["text"])
+        chunks = chunk_text(rec["text"], max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+        chunk_stats.add([approx_token_count(c) for c in chunks])
         for i, chunk in enumerate(chunks):
             texts.append(chunk)
             ids.append(f"{rec['id']}_chunk{i}")
             metadatas.append(clean_metadata(rec))
+    return texts, ids, metadatas
 
-    if not texts:
-        return 0
+def stamp_ingest(collection):
+    """Record the ingest time on the collection; the retriever folds it into its collection version."""
+    metadata = {k: v for k, v in (collection.metadata or {}).items() if not k.startswith("hnsw:")}
+    metadata["ingested_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    collection.modify(metadata=metadata)
 
-    embeddings = embed_texts(texts)
-    collection.add(
+def write_chunks(collection, ids, embeddings, texts, metadatas):
+    collection.upsert(
         ids=ids,
         embeddings=embeddings,
         documents=texts,
         metadatas=metadatas
     )
-    return len(records)
 
 # Stream functions for GCS blobs
 def stream_ndjson_from_blob(bucket, blob_name):
@@ -108,38 +126,131 @@ def upload_chroma_to_gcs(local_dir, bucket_name, dest_prefix):
             blob.upload_from_filename(local_path)
             logging.info(f"Uploaded {local_path} to gs://{bucket_name}/{blob_path}")
 
+def stream_blob(bucket, blob):
+    if blob.name.endswith(".ndjson"):
+        stream_func = stream_ndjson_from_blob
+    elif blob.name.endswith(".jsonl.gz"):
+        stream_func = stream_jsonl_gz_from_blob
+    else:
+        return
+    logging.info(f"Processing blob: {blob.name}")
+    yield from stream_func(bucket, blob.name)
+
+def remove_chunks(collection, state, ids):
+    if ids:
+        collection.delete(ids=ids)
+        state.forget_chunks(ids)
+        logging.info(f"Deleted {len(ids)} stale chunks")
+
 # Main ingestion function
-def ingest_from_gcs():
+def ingest_from_gcs(readers=INGEST_READERS, incremental=False, store_path=EMBEDDING_STORE_PATH,
+                    bm25_path=BM25_INDEX_PATH):
     logging.info(f"Connecting to GCS bucket: {BUCKET_NAME}")
     client = storage.Client.from_service_account_json(KEY_PATH)
     bucket = client.bucket(BUCKET_NAME)
-    all_blobs = list(bucket.list_blobs())
-    logging.info(f"Found {len(all_blobs)} blobs in bucket.")
-
-    total_ingested = 0
-    for blob in tqdm(all_blobs):
-        if blob.name.endswith(".ndjson"):
-            stream_func = stream_ndjson_from_blob
-        elif blob.name.endswith(".jsonl.gz"):
-            stream_func = stream_jsonl_gz_from_blob
-        else:
-            continue
+    all_blobs = [
+        b for b in bucket.list_blobs(prefix=INGEST_PREFIX or None) if b.name.endswith((".ndjson", ".jsonl.gz"))
+    ]
+    logging.info(f"Found {len(all_blobs)} record blobs in bucket{f' under {INGEST_PREFIX}' if INGEST_PREFIX else ''}.")
+
+    target, state, todo, orphaned = collection, None, all_blobs, []
+    if incremental:
+        # Diffing against a manifest only makes sense if the collection outlives this run
+        target = chromadb.PersistentClient(path=CHROMA_PATH).get_or_create_collection(COLLECTION_NAME)
+        ensure_collection_dim(target, EMBEDDING_DIM)
+        state = IngestState(INGEST_STATE_PATH, embedder=f"{EMBEDDING_BACKEND}:{MODEL_NAME}:{EMBEDDING_DIM}")
+        # Removed after the run, once chunks that moved to another blob have been re-pointed
+        orphaned = state.orphaned_blobs([b.name for b in all_blobs])
+        todo = [b for b in all_blobs if not state.blob_unchanged(b)]
+        logging.info(f"{len(all_blobs) - len(todo)} blobs unchanged since last ingest; reading {len(todo)}")
 
-        logging.info(f"Processing blob: {blob.name}")
-        batch = []
-        for record in stream_func(bucket, blob.name):
-            batch.append(record)
-            if len(batch) >= BATCH_SIZE:
-                total_ingested += store_records(batch, collection)
-                batch.clear()
+    def prepare(blob, records):
+        texts, ids, metadatas = prepare_records(records)
+        if state is not None:
+            return state.filter_changed(blob.name, texts, ids, metadatas)
+        return texts, ids, metadatas
 
-        if batch:
-            total_ingested += store_records(batch, collection)
+    # A full run tees every batch into the store and BM25 index; incremental runs rebuild both afterwards
+    store, bm25 = None, None
+    if store_path and not incremental:
+        store = EmbeddingStoreWriter(store_path, EMBEDDING_DIM, model=MODEL_NAME, backend=EMBEDDING_BACKEND)
+    if bm25_path and not incremental:
+        bm25 = BM25Builder()
 
-    logging.info(f"Finished ingesting {total_ingested} records into ChromaDB collection '{COLLECTION_NAME}'")
-    return collection  # return in-memory collection
+    def write(ids, embeddings, texts, metadatas):
+        write_chunks(target, ids, embeddings, texts, metadatas)
+        if store is not None:
+            store.add(ids, embeddings, texts, metadatas)
+        if bm25 is not None:
+            bm25.add(ids, texts, metadatas)
+        if state is not None:
+            state.commit_chunks(ids)
+
+    # Readers download and parse blobs concurrently while one stage embeds and another writes
+    progress = tqdm(total=len(todo))
+    done = []
+    def blob_done(blob):
+        progress.update(1)
+        done.append(blob)
+
+    pipeline = IngestPipeline(
+        read_blob=lambda blob: stream_blob(bucket, blob),
+        prepare=prepare,
+        embed=embed_texts,
+        write=write,
+        readers=readers,
+        queue_size=INGEST_QUEUE_SIZE,
+        batch_size=BATCH_SIZE,
+        on_blob_done=blob_done,
+    )
+    try:
+        stats = pipeline.run(todo)
+    except Exception:
+        if store is not None:
+            store.abort()
+        raise
+    finally:
+        progress.close()
+    if store is not None:
+        store.close()
+    if bm25 is not None:
+        bm25.save(bm25_path)
+
+    if state is not None:
+        # Only blobs whose chunks were all written are recorded, so a failed run is retried next time
+        for blob in done:
+            remove_chunks(target, state, state.stale_chunks(blob.name))
+            state.mark_blob(blob)
+        for name in orphaned:
+            logging.info(f"Source blob {name} disappeared; removing its chunks")
+            remove_chunks(target, state, state.chunks_for_blob(name))
+            state.forget_blob(name)
+        state.close()
+        if store_path:
+            export_collection(target, store_path, EMBEDDING_DIM, model=MODEL_NAME, backend=EMBEDDING_BACKEND)
+        if bm25_path:
+            build_from_collection(target, bm25_path)
+    # After stale chunks are gone, so readers keyed on it never see a half-updated collection as current
+    stamp_ingest(target)
+
+    logging.info(
+        f"Finished ingesting {stats['records']} records ({stats['chunks']} chunks embedded) "
+        f"into ChromaDB collection '{COLLECTION_NAME}' in {stats['wall_s']:.1f}s"
+    )
+    logging.info(f"Chunking report:\n{chunk_stats.report()}")
+    return target
 
 # Example usage
 if __name__ == "__main__":
-    ingest_from_gcs()
+    parser = argparse.ArgumentParser(description="Embed GCS records into ChromaDB")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only embed chunks that changed since the last run and delete removed ones")
+    parser.add_argument("--readers", type=int, default=INGEST_READERS, help="Concurrent blob readers")
+    parser.add_argument("--store", default=EMBEDDING_STORE_PATH,
+                        help="Directory for the on-disk embedding store ('' to skip)")
+    parser.add_argument("--bm25", default=BM25_INDEX_PATH,
+                        help="Directory for the BM25 keyword index ('' to skip)")
+    args = parser.parse_args()
+    ingest_from_gcs(readers=args.readers, incremental=args.incremental, store_path=args.store,
+                    bm25_path=args.bm25)
     logging.info("Upload Complete")
@@ -0,0 +1,125 @@
+"""
+Columnar on-disk copy of every embedded chunk, independent of Chroma.
+
+Layout of a store directory:
+  manifest.json          dim, dtype, model, backend and the list of shards
+  emb-00000.npy          float16 [rows, dim] matrix, memory-mappable with np.load(mmap_mode="r")
+  chunks-00000.parquet   id, document and metadata columns, row-aligned with the matching .npy
+
+Stores are written to a temporary sibling directory and swapped in on close,
+so readers never see a half-written store. Any index (Chroma, BM25, FAISS...)
+can be rebuilt from a store without running the embedding model; the
+retriever imports EmbeddingStore from here to rebuild its collection.
+"""
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+MANIFEST = "manifest.json"
+
+
+class EmbeddingStoreWriter:
+    def __init__(self, path, dim, model=None, backend=None, shard_rows=50000, dtype="float16"):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.shard_rows = shard_rows
+        self.manifest = {"dim": dim, "dtype": self.dtype.name, "model": model, "backend": backend,
+                         "count": 0, "shards": []}
+        self._embeddings = []
+        self._rows = []
+        self._buffered = 0
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+
+    def add(self, ids, embeddings, texts, metadatas):
+        emb = np.asarray(embeddings, dtype=self.dtype)
+        if emb.ndim != 2 or emb.shape[1] != self.dim:
+            raise ValueError(f"Expected [n, {self.dim}] embeddings, got {emb.shape}")
+        self._embeddings.append(emb)
+        self._rows.extend({"id": i, "document": t, **(m or {})} for i, t, m in zip(ids, texts, metadatas))
+        self._buffered += len(ids)
+        if self._buffered >= self.shard_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        n = len(self.manifest["shards"])
+        emb_file, rows_file = f"emb-{n:05d}.npy", f"chunks-{n:05d}.parquet"
+        np.save(os.path.join(self.tmp_path, emb_file), np.concatenate(self._embeddings))
+        pq.write_table(pa.Table.from_pylist(self._rows), os.path.join(self.tmp_path, rows_file))
+        self.manifest["shards"].append({"embeddings": emb_file, "chunks": rows_file, "rows": self._buffered})
+        self.manifest["count"] += self._buffered
+        self._embeddings, self._rows, self._buffered = [], [], 0
+
+    def close(self):
+        self._flush()
+        with open(os.path.join(self.tmp_path, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.path)
+        logging.info(f"Wrote {self.manifest['count']} embeddings to {self.path}")
+
+    def abort(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class EmbeddingStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.dim = self.manifest["dim"]
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    def iter_shards(self):
+        """Yield (embeddings, chunks) per shard; embeddings are read-only memory maps."""
+        for shard in self.manifest["shards"]:
+            emb = np.load(os.path.join(self.path, shard["embeddings"]), mmap_mode="r")
+            chunks = pq.read_table(os.path.join(self.path, shard["chunks"]))
+            yield emb, chunks
+
+    def rebuild_collection(self, collection, batch_size=5000):
+        """Load every stored vector into a Chroma collection without touching the model."""
+        total = 0
+        for emb, chunks in self.iter_shards():
+            rows = chunks.to_pylist()
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                collection.upsert(
+                    ids=[r.pop("id") for r in batch],
+                    documents=[r.pop("document") for r in batch],
+                    # Parquet fills keys missing from a row with nulls, which Chroma rejects
+                    metadatas=[{k: v for k, v in r.items() if v is not None} for r in batch],
+                    embeddings=np.asarray(emb[start:start + batch_size], dtype=np.float32).tolist(),
+                )
+                total += len(batch)
+        logging.info(f"Rebuilt {total} vectors into collection '{collection.name}' from {self.path}")
+        return total
+
+
+def export_collection(collection, path, dim, model=None, backend=None, page_size=5000):
+    """Snapshot an existing Chroma collection into a store."""
+    writer = EmbeddingStoreWriter(path, dim, model=model, backend=backend)
+    try:
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset,
+                                  include=["embeddings", "documents", "metadatas"])
+            if not page["ids"]:
+                break
+            writer.add(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+            offset += len(page["ids"])
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
@@ -0,0 +1,141 @@
+"""
+Manifest of what has already been embedded, for incremental ingestion.
+
+Stores the GCS generation/etag of every ingested blob and a content hash for
+every chunk id, so a refresh can skip unchanged blobs without downloading
+them, re-embed only chunks whose text or metadata changed, and delete chunks
+whose source disappeared. The embedder (backend, model, dimension) is stored
+alongside; when it changes every blob is re-read and every chunk re-embedded,
+so one collection never mixes vectors from two embedders.
+"""
+import hashlib
+import logging
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def chunk_hash(text, metadata):
+    payload = text + "\x1f" + json.dumps(metadata, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def blob_version(blob):
+    return f"{blob.generation}:{blob.etag}"
+
+
+class IngestState:
+    def __init__(self, path, embedder=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._seen = {}
+        with self._lock:
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS blobs (
+                    name TEXT PRIMARY KEY, version TEXT NOT NULL, ingested_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY, blob TEXT NOT NULL, content_hash TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_chunks_blob ON chunks(blob);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                """
+            )
+            self._db.commit()
+        if embedder is not None:
+            self._check_embedder(embedder)
+
+    def _check_embedder(self, embedder):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'embedder'").fetchone()
+            if row is None or row[0] != embedder:
+                # Keep chunk ownership so stale chunks are still found, but match no stored hash
+                reset = self._db.execute("UPDATE chunks SET content_hash = ''").rowcount
+                self._db.execute("DELETE FROM blobs")
+                if reset:
+                    logging.info(f"Embedder changed to {embedder}; re-embedding all {reset} chunks")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedder', ?)", (embedder,))
+            self._db.commit()
+
+    def blob_unchanged(self, blob):
+        with self._lock:
+            row = self._db.execute("SELECT version FROM blobs WHERE name = ?", (blob.name,)).fetchone()
+        return row is not None and row[0] == blob_version(blob)
+
+    def filter_changed(self, blob_name, texts, ids, metadatas):
+        """
+        Drop chunks whose stored hash matches; stage the rest to be committed once written.
+        An unchanged chunk that now comes from another blob is re-pointed to it, so it is
+        not deleted as stale when its previous blob is re-read or disappears.
+        """
+        hashes = [chunk_hash(t, m) for t, m in zip(texts, metadatas)]
+        with self._lock:
+            self._seen.setdefault(blob_name, set()).update(ids)
+            stored = {cid: (blob, h) for cid, blob, h in self._db.execute(
+                f"SELECT id, blob, content_hash FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()} if ids else {}
+            keep, moved = [], []
+            for i, (cid, h) in enumerate(zip(ids, hashes)):
+                blob, stored_hash = stored.get(cid, (None, None))
+                if stored_hash != h:
+                    keep.append(i)
+                    self._pending[cid] = (blob_name, h)
+                elif blob != blob_name:
+                    moved.append((blob_name, cid))
+            if moved:
+                self._db.executemany("UPDATE chunks SET blob = ? WHERE id = ?", moved)
+                self._db.commit()
+        return [texts[i] for i in keep], [ids[i] for i in keep], [metadatas[i] for i in keep]
+
+    def commit_chunks(self, ids):
+        with self._lock:
+            rows = [(cid, *self._pending.pop(cid)) for cid in ids if cid in self._pending]
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (id, blob, content_hash) VALUES (?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def stale_chunks(self, blob_name):
+        """Chunk ids previously ingested from a re-read blob that it no longer produces."""
+        with self._lock:
+            seen = self._seen.get(blob_name, set())
+            rows = self._db.execute("SELECT id FROM chunks WHERE blob = ?", (blob_name,)).fetchall()
+        return [cid for (cid,) in rows if cid not in seen]
+
+    def orphaned_blobs(self, current_names):
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT blob FROM chunks").fetchall()
+            rows += self._db.execute("SELECT name FROM blobs").fetchall()
+        return sorted({name for (name,) in rows} - set(current_names))
+
+    def chunks_for_blob(self, blob_name):
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM chunks WHERE blob = ?", (blob_name,)).fetchall()
+        return [cid for (cid,) in rows]
+
+    def forget_chunks(self, ids):
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(cid,) for cid in ids])
+            self._db.commit()
+
+    def forget_blob(self, blob_name):
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE blob = ?", (blob_name,))
+            self._db.execute("DELETE FROM blobs WHERE name = ?", (blob_name,))
+            self._db.commit()
+
+    def mark_blob(self, blob):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (name, version, ingested_at) VALUES (?, ?, ?)",
+                (blob.name, blob_version(blob), time.time()),
+            )
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,153 @@
+"""
+Pipelined ingestion: a pool of blob readers, one embedding stage and one writer stage.
+
+Stages are connected by bounded queues, so a slow embedder applies backpressure
+to the readers instead of letting parsed records pile up in memory, and a
+slow Chroma write overlaps with embedding of the next batch.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class IngestPipeline:
+    """
+    read_blob(blob)          -> iterable of records
+    prepare(blob, records)   -> (texts, ids, metadatas) ready to embed
+    embed(texts)             -> list of vectors
+    write(ids, embeddings, texts, metadatas)
+    """
+
+    def __init__(self, read_blob, prepare, embed, write, readers=4, queue_size=8, batch_size=64,
+                 on_blob_done=None):
+        self.read_blob = read_blob
+        self.prepare = prepare
+        self.embed = embed
+        self.write = write
+        self.readers = max(1, readers)
+        self.batch_size = batch_size
+        self.on_blob_done = on_blob_done
+        self._to_embed = queue.Queue(maxsize=queue_size)
+        self._to_write = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._stop = threading.Event()
+        self.stats = {
+            "blobs": 0,
+            "records": 0,
+            "chunks": 0,
+            "read_s": 0.0,
+            "embed_s": 0.0,
+            "write_s": 0.0,
+        }
+        self._stats_lock = threading.Lock()
+
+    def _add_stat(self, key, value):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _fail(self, exc):
+        if self._error is None:
+            self._error = exc
+        self._stop.set()
+
+    def _put(self, q, item):
+        # Blocks while the downstream stage is behind, but gives up once another stage has failed
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _read(self, blob):
+        try:
+            start = time.perf_counter()
+            batch = []
+            for record in self.read_blob(blob):
+                if self._stop.is_set():
+                    return
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self._emit(blob, batch)
+                    batch = []
+            if batch:
+                self._emit(blob, batch)
+            self._add_stat("read_s", time.perf_counter() - start)
+            self._add_stat("blobs", 1)
+            if self.on_blob_done is not None:
+                self.on_blob_done(blob)
+        except Exception as e:
+            logging.error(f"Reader failed on {getattr(blob, 'name', blob)}: {e}")
+            self._fail(e)
+
+    def _emit(self, blob, records):
+        texts, ids, metadatas = self.prepare(blob, records)
+        self._add_stat("records", len(records))
+        if texts:
+            self._put(self._to_embed, (texts, ids, metadatas))
+
+    def _embed_stage(self):
+        while True:
+            item = self._get(self._to_embed)
+            if item is _DONE:
+                break
+            texts, ids, metadatas = item
+            try:
+                start = time.perf_counter()
+                embeddings = self.embed(texts)
+                self._add_stat("embed_s", time.perf_counter() - start)
+            except Exception as e:
+                logging.error(f"Embedding stage failed: {e}")
+                self._fail(e)
+                break
+            self._put(self._to_write, (ids, embeddings, texts, metadatas))
+        self._put(self._to_write, _DONE)
+
+    def _write_stage(self):
+        while True:
+            item = self._get(self._to_write)
+            if item is _DONE:
+                break
+            ids, embeddings, texts, metadatas = item
+            try:
+                start = time.perf_counter()
+                self.write(ids, embeddings, texts, metadatas)
+                self._add_stat("write_s", time.perf_counter() - start)
+                self._add_stat("chunks", len(ids))
+            except Exception as e:
+                logging.error(f"Writer stage failed: {e}")
+                self._fail(e)
+                break
+
+    def run(self, blobs):
+        start = time.perf_counter()
+        embedder = threading.Thread(target=self._embed_stage, name="ingest-embed", daemon=True)
+        writer = threading.Thread(target=self._write_stage, name="ingest-write", daemon=True)
+        embedder.start()
+        writer.start()
+
+        with ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="ingest-read") as pool:
+            list(pool.map(self._read, blobs))
+
+        self._put(self._to_embed, _DONE)
+        embedder.join()
+        writer.join()
+
+        self.stats["wall_s"] = time.perf_counter() - start
+        logging.info(f"Pipeline stats: {self.stats}")
+        if self._error is not None:
+            raise self._error
+        return self.stats
@@ -0,0 +1,53 @@
+"""Incremental ingest bookkeeping: python -m pytest test_ingest_state.py (from src/embedder)"""
+from types import SimpleNamespace
+
+from ingest_state import IngestState
+
+META = {"title": "t", "source_url": "u", "doctype": "d", "authority": "a", "year": 2024}
+
+
+def blob(name, generation=1):
+    return SimpleNamespace(name=name, generation=generation, etag="e")
+
+
+def ingest(state, name, chunks):
+    """One blob's pass through filter_changed + commit_chunks; returns the ids that were re-embedded."""
+    ids = list(chunks)
+    texts, kept, metas = state.filter_changed(name, [chunks[c] for c in ids], ids, [META] * len(ids))
+    state.commit_chunks(kept)
+    state.mark_blob(blob(name))
+    return kept
+
+
+def test_chunk_moving_between_blobs_is_not_deleted(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    state = IngestState(path)
+    ingest(state, "irs/2023/a.ndjson", {"c1": "same text", "c2": "other"})
+    state.close()
+
+    # c1 is re-sharded into b; a now only produces c2
+    state = IngestState(path)
+    assert ingest(state, "irs/2024/b.ndjson", {"c1": "same text"}) == []
+    assert ingest(state, "irs/2023/a.ndjson", {"c2": "other"}) == []
+    assert state.stale_chunks("irs/2023/a.ndjson") == []
+    assert state.chunks_for_blob("irs/2024/b.ndjson") == ["c1"]
+
+    # and a blob that disappears does not take the moved chunk with it
+    assert state.chunks_for_blob("irs/2023/a.ndjson") == ["c2"]
+
+
+def test_embedder_change_re_embeds_everything(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    state = IngestState(path, embedder="torch:model:1024")
+    ingest(state, "a.ndjson", {"c1": "text", "c2": "more"})
+    state.close()
+
+    state = IngestState(path, embedder="torch:model:1024")
+    assert state.blob_unchanged(blob("a.ndjson"))
+    state.close()
+
+    state = IngestState(path, embedder="onnx-int8:model:1024")
+    assert not state.blob_unchanged(blob("a.ndjson"))
+    assert sorted(ingest(state, "a.ndjson", {"c1": "text", "c2": "more"})) == ["c1", "c2"]
+    # ownership survives the reset, so dropped chunks are still found as stale
+    assert state.stale_chunks("a.ndjson") == []
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+def context_fingerprint(ids):
+    """Order-independent fingerprint of the retrieved chunk ids."""
+    return hashlib.sha1("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    fingerprint: str
+    version: str
+    embedding: list
+    answer: str
+    created: float
+    cost: float = 0.0
+    llm_seconds: float = 0.0
+
+
+class MemoryStore:
+    """No persistence: entries live only in the process."""
+
+    def load(self):
+        return []
+
+    def save(self, entry):
+        pass
+
+    def delete(self, keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+class SQLiteStore:
+    """Write-through SQLite persistence so cached answers survive restarts."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT, version TEXT, embedding TEXT, answer TEXT, "
+                "created REAL, cost REAL, llm_seconds REAL)"
+            )
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, fingerprint, version, embedding, answer, created, cost, llm_seconds "
+                "FROM answers ORDER BY created"
+            ).fetchall()
+        return [
+            CacheEntry(key, fp, version, json.loads(emb), answer, created, cost, llm_seconds)
+            for key, fp, version, emb, answer, created, cost, llm_seconds in rows
+        ]
+
+    def save(self, entry):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.key, entry.fingerprint, entry.version, json.dumps(entry.embedding), entry.answer,
+                 entry.created, entry.cost, entry.llm_seconds),
+            )
+
+    def delete(self, keys):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in keys])
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by (retrieved-context fingerprint, query embedding): a lookup
+    hits when the same chunks were retrieved and the query embedding is within
+    `threshold` cosine similarity of a cached query. Entries expire after
+    `ttl_seconds`, the least recently used are evicted past `max_entries`, and
+    everything is dropped when the retriever's collection version changes.
+    """
+
+    def __init__(self, store=None, threshold=0.95, ttl_seconds=86400, max_entries=5000):
+        self.store = store or MemoryStore()
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.cost_saved = 0.0
+        self.seconds_saved = 0.0
+        self._entries = OrderedDict()
+        self._by_fingerprint = {}
+        self._lock = threading.Lock()
+        for entry in self.store.load():
+            self._insert(entry)
+        if self._entries:
+            self.version = next(reversed(self._entries.values())).version
+
+    def _insert(self, entry):
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        self._by_fingerprint.setdefault(entry.fingerprint, set()).add(entry.key)
+
+    def _remove(self, keys):
+        for key in keys:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                group = self._by_fingerprint.get(entry.fingerprint, set())
+                group.discard(key)
+                if not group:
+                    self._by_fingerprint.pop(entry.fingerprint, None)
+        self.store.delete(keys)
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+                self._by_fingerprint.clear()
+                self.store.clear()
+            self.version = version
+
+    def get(self, embedding, ids, version):
+        """Return the cached answer for a near-identical query over the same context, or None."""
+        fingerprint = context_fingerprint(ids)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            candidates = [self._entries[k] for k in self._by_fingerprint.get(fingerprint, ())]
+            expired = [e.key for e in candidates if now - e.created > self.ttl_seconds]
+            if expired:
+                self._remove(expired)
+            best, best_sim = None, self.threshold
+            for entry in candidates:
+                if entry.key in expired:
+                    continue
+                sim = _cosine(embedding, entry.embedding)
+                if sim >= best_sim:
+                    best, best_sim = entry, sim
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best.key)
+            self.hits += 1
+            self.cost_saved += best.cost
+            self.seconds_saved += best.llm_seconds
+            return best.answer
+
+    def put(self, embedding, ids, version, answer, cost=0.0, llm_seconds=0.0):
+        fingerprint = context_fingerprint(ids)
+        key = hashlib.sha1(f"{fingerprint}|{json.dumps(embedding)}".encode("utf-8")).hexdigest()
+        entry = CacheEntry(key, fingerprint, version, list(embedding), answer, time.time(), cost, llm_seconds)
+        with self._lock:
+            self._check_version(version)
+            self._insert(entry)
+            self.store.save(entry)
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._remove(list(self._entries)[:overflow])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "cost_saved_usd": round(self.cost_saved, 6),
+            "llm_seconds_saved": round(self.seconds_saved, 3),
+        }
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import logging
 from langchain_google_vertexai import VertexAI
 from dotenv import load_dotenv
@@ -13,9 +14,22 @@ if VERTEXAI_CREDENTIALS is None:
 
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = VERTEXAI_CREDENTIALS
 
+# Upper bound on concurrent Gemini calls from this process
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "256"))
+
 # Initialize the LLM
 llm = VertexAI(model_name="gemini-2.5-pro")
 
+_llm_slots = None
+
+
+def _slots():
+    # Created lazily so the semaphore binds to the running event loop
+    global _llm_slots
+    if _llm_slots is None:
+        _llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _llm_slots
+
 
 def query_llm(prompt: str) -> str:
     """
@@ -28,3 +42,27 @@ def query_llm(prompt: str) -> str:
     except Exception as e:
         logging.error(f"Error querying LLM: {e}")
         return f"Error: {str(e)}"
+
+
+async def aquery_llm(prompt: str) -> str:
+    """
+    Async variant of query_llm using the Vertex async invoke path, so the
+    event loop keeps serving other queries while Gemini generates.
+    """
+    try:
+        async with _slots():
+            return await llm.ainvoke(prompt)
+    except Exception as e:
+        logging.error(f"Error querying LLM: {e}")
+        return f"Error: {str(e)}"
+
+
+async def astream_llm(prompt: str):
+    """
+    Stream the answer as text chunks as Gemini produces them. Errors are
+    raised to the caller, which has already started its response.
+    """
+    async with _slots():
+        async for chunk in llm.astream(prompt):
+            if chunk:
+                yield chunk
@@ -1,42 +1,291 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import requests
+from typing import Optional
+import httpx
+import json
+import logging
 import os
-from .language import query_llm  # Import the function above
-
-app = FastAPI()
+import time
+from .language import aquery_llm, astream_llm  # Import the functions above
+from .answer_cache import MemoryStore, SemanticAnswerCache, SQLiteStore
+from .metrics import LatencyTracker
+from .orchestrator import DeadlineExceeded, QueryOrchestrator, RetrieverError
+from .prompt_builder import approx_token_count, build_prompt
 
 RETRIEVER_URL = os.environ.get("RETRIEVER_URL", "http://retriever:8000/retrieve")
+# Structured results (ids, documents, query embedding, collection version) for the answer cache
+RETRIEVER_SEARCH_URL = os.environ.get("RETRIEVER_SEARCH_URL", RETRIEVER_URL.rsplit("/", 1)[0] + "/search")
+
+# Pooled retriever client: connection limits, keep-alive and timeouts in seconds
+RETRIEVER_MAX_CONNECTIONS = int(os.environ.get("RETRIEVER_MAX_CONNECTIONS", "100"))
+RETRIEVER_MAX_KEEPALIVE = int(os.environ.get("RETRIEVER_MAX_KEEPALIVE", "20"))
+RETRIEVER_KEEPALIVE_EXPIRY = float(os.environ.get("RETRIEVER_KEEPALIVE_EXPIRY", "30"))
+RETRIEVER_CONNECT_TIMEOUT = float(os.environ.get("RETRIEVER_CONNECT_TIMEOUT", "2"))
+RETRIEVER_TIMEOUT = float(os.environ.get("RETRIEVER_TIMEOUT", "10"))
+
+# Semantic answer cache: "memory", "sqlite" or "off", plus match threshold, TTL and size
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "memory")
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "/app/src/answer_cache.sqlite3")
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "5000"))
+# USD per 1k tokens, used to report what cache hits saved
+LLM_INPUT_COST_PER_1K = float(os.environ.get("LLM_INPUT_COST_PER_1K", "0.00125"))
+LLM_OUTPUT_COST_PER_1K = float(os.environ.get("LLM_OUTPUT_COST_PER_1K", "0.01"))
+
+# Prompt packing: total prompt budget, per-passage cap and smallest useful trimmed passage, in tokens
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "6000"))
+PASSAGE_MAX_TOKENS = int(os.environ.get("PASSAGE_MAX_TOKENS", "800"))
+PASSAGE_MIN_TOKENS = int(os.environ.get("PASSAGE_MIN_TOKENS", "64"))
+
+# End-to-end deadline per query, the share retrieval may use, and the hedge delay used until p95 is known
+QUERY_DEADLINE_MS = float(os.environ.get("QUERY_DEADLINE_MS", "30000"))
+RETRIEVE_BUDGET_MS = float(os.environ.get("RETRIEVE_BUDGET_MS", "3000"))
+HEDGE_DELAY_MS = float(os.environ.get("HEDGE_DELAY_MS", "250"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One client for the process so retriever connections are reused across queries
+    app.state.retriever = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=RETRIEVER_MAX_CONNECTIONS,
+            max_keepalive_connections=RETRIEVER_MAX_KEEPALIVE,
+            keepalive_expiry=RETRIEVER_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(RETRIEVER_TIMEOUT, connect=RETRIEVER_CONNECT_TIMEOUT),
+    )
+    yield
+    await app.state.retriever.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+latency = LatencyTracker()
+orchestrator = QueryOrchestrator(
+    latency,
+    retrieve_budget_s=RETRIEVE_BUDGET_MS / 1000,
+    hedge_delay_s=HEDGE_DELAY_MS / 1000,
+)
+prompt_usage = {"prompts": 0, "prompt_tokens": 0, "max_prompt_tokens": 0, "passages_trimmed": 0,
+                "passages_dropped": 0}
+answer_cache = None
+if ANSWER_CACHE != "off":
+    answer_cache = SemanticAnswerCache(
+        store=SQLiteStore(ANSWER_CACHE_PATH) if ANSWER_CACHE == "sqlite" else MemoryStore(),
+        threshold=ANSWER_CACHE_THRESHOLD,
+        ttl_seconds=ANSWER_CACHE_TTL,
+        max_entries=ANSWER_CACHE_SIZE,
+    )
 
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
+    token_budget: Optional[int] = None  # prompt token budget; default PROMPT_TOKEN_BUDGET
+    deadline_ms: Optional[float] = None  # end-to-end deadline; default QUERY_DEADLINE_MS
+
+
+async def search(request: QueryRequest, deadline: float):
+    """
+    Retrieved chunks for the query (with its embedding when the answer cache
+    needs it) and where they came from: "fresh", "cached_context" or "no_context".
+    """
+    payload = {"user_query": request.query, "top_k": request.top_k, "include_embedding": answer_cache is not None}
+    return await orchestrator.retrieve(app.state.retriever, RETRIEVER_SEARCH_URL, payload, deadline)
+
+
+def query_deadline(request: QueryRequest, start: float) -> float:
+    return start + (request.deadline_ms or QUERY_DEADLINE_MS) / 1000
+
+
+def pack_prompt(request: QueryRequest, result: dict):
+    packed = build_prompt(
+        request.query,
+        result.get("documents") or [],
+        result.get("metadatas"),
+        token_budget=request.token_budget or PROMPT_TOKEN_BUDGET,
+        max_passage_tokens=PASSAGE_MAX_TOKENS,
+        min_passage_tokens=PASSAGE_MIN_TOKENS,
+    )
+    prompt_usage["prompts"] += 1
+    prompt_usage["prompt_tokens"] += packed.prompt_tokens
+    prompt_usage["max_prompt_tokens"] = max(prompt_usage["max_prompt_tokens"], packed.prompt_tokens)
+    prompt_usage["passages_trimmed"] += packed.passages_trimmed
+    prompt_usage["passages_dropped"] += packed.passages_dropped
+    return packed
+
+
+def cached_answer(result: dict):
+    if answer_cache is None or "query_embedding" not in result:
+        return None
+    return answer_cache.get(result["query_embedding"], result["ids"], result.get("collection_version"))
+
+
+def cache_answer(result: dict, packed, answer: str, llm_seconds: float):
+    if answer_cache is None or "query_embedding" not in result:
+        return
+    cost = (packed.prompt_tokens * LLM_INPUT_COST_PER_1K + approx_token_count(answer) * LLM_OUTPUT_COST_PER_1K) / 1000
+    answer_cache.put(
+        result["query_embedding"], result["ids"], result.get("collection_version"), answer,
+        cost=cost, llm_seconds=llm_seconds,
+    )
+
+
+def sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @app.post("/query")
-def llm_endpoint(request: QueryRequest):
+async def llm_endpoint(request: QueryRequest):
     """
     This endpoint:
-    1. Calls the Retriever service for context
+    1. Calls the Retriever service for context (hedged, within its share of the deadline)
     2. Sends the context + query to the LLM
-    3. Returns the generated answer
+    3. Returns the generated answer with per-stage timings
     """
+    start = time.perf_counter()
+    deadline = query_deadline(request, start)
+    timings = {}
     try:
         # Step 1: call the retriever
-        retriever_resp = requests.post(
-            RETRIEVER_URL, json={"user_query": request.query, "top_k": request.top_k}
-        )
-        retriever_resp.raise_for_status()
-        context = retriever_resp.json().get("context", "")
+        result, context_source = await search(request, deadline)
+        timings["retrieve_ms"] = (time.perf_counter() - start) * 1000
 
-        # Step 2: build prompt for LLM
-        prompt = f"Answer using the following context:\n{context}\n\nQuery: {request.query}"
+        # A paraphrase of a cached question over the same context reuses its answer
+        answer = cached_answer(result)
+        if answer is not None:
+            latency.record("total", time.perf_counter() - start)
+            timings["total_ms"] = (time.perf_counter() - start) * 1000
+            return {"answer": answer, "cached": True, "context": context_source, "timings": timings}
 
-        # Step 3: call LLM via language.py
-        answer = query_llm(prompt)
+        # Step 2: pack the passages into a cited prompt under the token budget
+        with latency.time("pack"):
+            packed = pack_prompt(request, result)
 
-        return {"answer": answer}
+        # Step 3: call LLM via language.py, cancelled if it would overrun the deadline
+        llm_start = time.perf_counter()
+        answer = await orchestrator.within(aquery_llm(packed.prompt), deadline)
+        llm_seconds = time.perf_counter() - llm_start
+        latency.record("llm", llm_seconds)
+        timings["llm_ms"] = llm_seconds * 1000
+        if answer.strip() and not answer.startswith("Error:"):
+            cache_answer(result, packed, answer, llm_seconds)
 
+        # No "ttft" sample here: it would be the whole end-to-end latency and skew /query/stream's
+        latency.record("total", time.perf_counter() - start)
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        return {
+            "answer": answer,
+            "cached": False,
+            "context": context_source,
+            "usage": packed.usage(),
+            "sources": packed.sources,
+            "timings": timings,
+        }
+
+    except DeadlineExceeded as e:
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        raise HTTPException(status_code=504, detail={"error": str(e), "timings": timings})
+    except RetrieverError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/query/stream")
+async def llm_stream_endpoint(request: QueryRequest):
+    """
+    Server-sent events variant of /query: one `data: {"token": ...}` event per
+    chunk as Gemini produces it, then an `event: done` carrying the
+    time-to-first-token and total latency (or `event: error`). The deadline
+    bounds retrieval and the wait for the first token.
+    """
+    start = time.perf_counter()
+    deadline = query_deadline(request, start)
+    try:
+        result, context_source = await search(request, deadline)
+    except RetrieverError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    cached = cached_answer(result)
+    packed = pack_prompt(request, result) if cached is None else None
+
+    async def events():
+        if cached is not None:
+            yield sse({"token": cached})
+            total = time.perf_counter() - start
+            latency.record("total", total)
+            yield sse(
+                {"ttft_ms": total * 1000, "total_ms": total * 1000, "cached": True, "context": context_source},
+                event="done",
+            )
+            return
+
+        ttft = None
+        tokens = []
+        completed = False
+        llm_start = time.perf_counter()
+        stream = astream_llm(packed.prompt)
+        try:
+            try:
+                first = await orchestrator.within(anext(stream), deadline)
+            except StopAsyncIteration:
+                first = None
+            if first is not None:
+                ttft = time.perf_counter() - start
+                latency.record("ttft", ttft)
+                tokens.append(first)
+                yield sse({"token": first})
+                async for token in stream:
+                    tokens.append(token)
+                    yield sse({"token": token})
+            # Not reached if the client disconnects mid-stream (the generator is closed at a yield)
+            completed = True
+        except Exception as e:
+            logging.error(f"Error streaming from LLM: {e}")
+            yield sse({"detail": str(e)}, event="error")
+            return
+        llm_seconds = time.perf_counter() - llm_start
+        total = time.perf_counter() - start
+        latency.record("llm", llm_seconds)
+        latency.record("total", total)
+        answer = "".join(tokens)
+        # Only a finished, non-empty answer is worth serving to the next paraphrase
+        if completed and answer.strip():
+            cache_answer(result, packed, answer, llm_seconds)
+        yield sse(
+            {
+                "ttft_ms": ttft * 1000 if ttft is not None else None,
+                "total_ms": total * 1000,
+                "cached": False,
+                "context": context_source,
+                "usage": packed.usage(),
+                "sources": packed.sources,
+            },
+            event="done",
+        )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics")
+def metrics():
+    """Per-stage latency, prompt token usage, answer cache hit rate / savings and hedging / fallback counts."""
+    prompts = prompt_usage["prompts"]
+    return {
+        "latency": latency.stats(),
+        "prompt_usage": {
+            **prompt_usage,
+            "mean_prompt_tokens": prompt_usage["prompt_tokens"] / prompts if prompts else 0.0,
+        },
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "orchestrator": orchestrator.stats(),
+    }
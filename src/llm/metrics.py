@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class LatencyTracker:
+    """Rolling window of per-stage latencies (retrieve, ttft, llm, total) with percentiles."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def percentile(self, stage, q, min_samples=20):
+        """q-th percentile of `stage` in seconds, or None until `min_samples` have been recorded."""
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if len(samples) < min_samples:
+            return None
+        return _percentile(samples, q)
+
+    def stats(self):
+        with self._lock:
+            snapshot = {stage: sorted(samples) for stage, samples in self._samples.items()}
+            counts = dict(self._counts)
+        return {
+            stage: {
+                "count": counts[stage],
+                "mean_ms": sum(samples) / len(samples) * 1000,
+                "p50_ms": _percentile(samples, 50) * 1000,
+                "p95_ms": _percentile(samples, 95) * 1000,
+            }
+            for stage, samples in snapshot.items()
+            if samples
+        }
+
+
+def _percentile(ordered, q):
+    # Linear interpolation between closest ranks, as numpy.percentile does by default
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+
+import httpx
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class RetrieverError(Exception):
+    """
+    The retriever failed outright rather than being slow. Queries are not
+    answered without grounding in that case; `status_code` is what /query
+    returns (503 if it could not be reached, 502 if it answered with an error).
+    """
+
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class QueryOrchestrator:
+    """
+    Bounds retrieval inside a query's end-to-end deadline.
+
+    The retriever call is hedged: if it has not answered after the observed
+    p95 call latency, an identical request is fired and whichever finishes
+    first wins. If neither answers within the retrieval budget, the most
+    recent context retrieved for the same query is reused, or the query goes
+    ahead with no context, so the LLM stage always gets its share of the
+    deadline.
+
+    Those fallbacks are only for a slow retriever. When the calls fail
+    (connection errors or error responses) RetrieverError is raised instead,
+    and a 4xx response is neither hedged nor retried since it cannot succeed.
+    """
+
+    def __init__(self, latency, retrieve_budget_s=3.0, hedge_delay_s=0.25, hedge_min_delay_s=0.02,
+                 context_cache_size=1024):
+        self.latency = latency
+        self.retrieve_budget_s = retrieve_budget_s
+        self.hedge_delay_s = hedge_delay_s
+        self.hedge_min_delay_s = hedge_min_delay_s
+        self.context_cache_size = context_cache_size
+        self.counters = Counter()
+        self._contexts = OrderedDict()
+
+    def hedge_delay(self):
+        p95 = self.latency.percentile("retrieve_call", 95)
+        return max(p95 if p95 is not None else self.hedge_delay_s, self.hedge_min_delay_s)
+
+    async def _call(self, client, url, payload):
+        start = time.perf_counter()
+        resp = await client.post(url, json=payload)
+        resp.raise_for_status()
+        self.latency.record("retrieve_call", time.perf_counter() - start)
+        return resp.json()
+
+    async def retrieve(self, client, url, payload, deadline):
+        """
+        Return (result, source) where source is "fresh", "cached_context" or
+        "no_context". `deadline` is an absolute time.perf_counter() value.
+        Raises RetrieverError if every call failed before the budget ran out.
+        """
+        start = time.perf_counter()
+        budget_end = min(start + self.retrieve_budget_s, deadline)
+        tasks = [asyncio.create_task(self._call(client, url, payload))]
+        pending = set(tasks)
+        hedge_at = start + self.hedge_delay()
+        error = None
+        try:
+            while pending:
+                now = time.perf_counter()
+                if now >= budget_end:
+                    break
+                # Wait for an answer, but wake up in time to fire the hedge
+                wake = budget_end if len(tasks) > 1 else min(hedge_at, budget_end)
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(wake - now, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1 and task is tasks[1]:
+                            self.counters["hedge_wins"] += 1
+                        result = task.result()
+                        self._remember(payload, result)
+                        self.latency.record("retrieve", time.perf_counter() - start)
+                        return result, "fresh"
+                    error = task.exception()
+                    logging.warning(f"Retriever call failed: {error}")
+                    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code < 500:
+                        # The request itself is bad; a second copy would fail the same way
+                        self.counters["retriever_errors"] += 1
+                        raise RetrieverError(
+                            f"retriever rejected the request ({error.response.status_code})", status_code=502
+                        ) from error
+                # Hedge once: on the p95 timer, or straight away if the first call failed
+                if len(tasks) == 1 and (not pending or time.perf_counter() >= hedge_at):
+                    self.counters["hedged"] += 1
+                    tasks.append(asyncio.create_task(self._call(client, url, payload)))
+                    pending.add(tasks[1])
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self.latency.record("retrieve", time.perf_counter() - start)
+        if not pending and error is not None:
+            # Both calls failed (not timed out): surface the outage rather than answer ungrounded
+            self.counters["retriever_errors"] += 1
+            status = 502 if isinstance(error, httpx.HTTPStatusError) else 503
+            raise RetrieverError(f"retriever unavailable: {error}", status_code=status) from error
+        cached = self._contexts.get(_context_key(payload))
+        if cached is not None:
+            self.counters["cached_context"] += 1
+            return cached, "cached_context"
+        self.counters["no_context"] += 1
+        return {"ids": [], "documents": [], "metadatas": []}, "no_context"
+
+    def _remember(self, payload, result):
+        key = _context_key(payload)
+        self._contexts[key] = result
+        self._contexts.move_to_end(key)
+        while len(self._contexts) > self.context_cache_size:
+            self._contexts.popitem(last=False)
+
+    async def within(self, awaitable, deadline):
+        """Await `awaitable`, cancelling it with DeadlineExceeded once `deadline` passes."""
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            self.counters["deadline_exceeded"] += 1
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded("query deadline exceeded before the LLM call")
+        try:
+            return await asyncio.wait_for(awaitable, timeout=remaining)
+        except asyncio.TimeoutError:
+            self.counters["deadline_exceeded"] += 1
+            raise DeadlineExceeded("query deadline exceeded waiting for the LLM") from None
+
+    def stats(self):
+        return {**self.counters, "hedge_delay_ms": self.hedge_delay() * 1000, "cached_contexts": len(self._contexts)}
+
+
+def _context_key(payload):
+    return (" ".join(payload["user_query"].lower().split()), payload.get("top_k"))
@@ -0,0 +1,121 @@
+"""
+Packs retrieved passages into the LLM prompt under a token budget.
+
+Passages arrive best first from the retriever. Each is trimmed to
+`max_passage_tokens` on a sentence boundary. They are then added in
+relevance order while they fit the budget; a passage that no longer fits
+whole is trimmed into the remaining space if at least `min_passage_tokens`
+are left, otherwise skipped for smaller ones further down. Passages from the
+same source URL share one citation number.
+
+Token counts use the same word/punctuation approximation as the embedder's
+chunker, which tracks Gemini's tokenizer closely enough for budgeting.
+"""
+import re
+from dataclasses import dataclass, field
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+INSTRUCTIONS = "Answer using the following context. Cite the sources you use by their [number]."
+
+
+def approx_token_count(text):
+    return len(_TOKEN.findall(text))
+
+
+def trim_to_tokens(text, max_tokens):
+    """Cut `text` to at most `max_tokens`, on the last sentence boundary that fits if there is one."""
+    if approx_token_count(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        n = approx_token_count(sentence)
+        if used + n > max_tokens:
+            break
+        kept.append(sentence)
+        used += n
+    if kept:
+        return " ".join(kept)
+    # A single sentence longer than the budget: cut at the last token that fits
+    end = list(_TOKEN.finditer(text))[max_tokens - 1].end() if max_tokens > 0 else 0
+    return text[:end] + " …"
+
+
+@dataclass
+class PackedPrompt:
+    prompt: str
+    prompt_tokens: int
+    context_tokens: int
+    passages_used: int
+    passages_trimmed: int
+    passages_dropped: int
+    sources: list = field(default_factory=list)
+
+    def usage(self):
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "context_tokens": self.context_tokens,
+            "passages_used": self.passages_used,
+            "passages_trimmed": self.passages_trimmed,
+            "passages_dropped": self.passages_dropped,
+        }
+
+
+def build_prompt(query, documents, metadatas=None, token_budget=6000, max_passage_tokens=800,
+                 min_passage_tokens=64):
+    """Pack `documents` (best first) into a cited prompt whose context fits `token_budget` tokens."""
+    metadatas = metadatas or [{}] * len(documents)
+    fixed = approx_token_count(INSTRUCTIONS) + approx_token_count(query) + 8
+    remaining = max(token_budget - fixed, 0)
+
+    citations = {}
+    sources = []
+    blocks = []
+    seen_text = set()
+    trimmed = dropped = 0
+    for text, meta in zip(documents, metadatas):
+        meta = meta or {}
+        text = (text or "").strip()
+        if not text or text in seen_text:
+            dropped += 1
+            continue
+        passage = trim_to_tokens(text, max_passage_tokens)
+        source = meta.get("source_url") or meta.get("title") or f"passage-{len(blocks)}"
+        # Citation headers cost tokens too; a new source also adds a line to the source list
+        new_source = source not in citations
+        header_cost = 4 + (approx_token_count(f"{meta.get('title', '')} {source}") if new_source else 0)
+        n = approx_token_count(passage) + header_cost
+        if n > remaining:
+            if remaining - header_cost < min_passage_tokens:
+                dropped += 1
+                continue
+            passage = trim_to_tokens(passage, remaining - header_cost)
+            n = approx_token_count(passage) + header_cost
+        if passage != text:
+            trimmed += 1
+        if new_source:
+            citations[source] = len(citations) + 1
+            sources.append({"n": citations[source], "title": meta.get("title"), "source_url": meta.get("source_url")})
+        seen_text.add(text)
+        blocks.append(f"[{citations[source]}] {passage}")
+        remaining -= n
+
+    if blocks:
+        source_lines = "\n".join(
+            f"[{s['n']}] {s['title'] or s['source_url']}" + (f" - {s['source_url']}" if s["title"] and s["source_url"] else "")
+            for s in sources
+        )
+        context = "\n\n".join(blocks) + f"\n\nSources:\n{source_lines}"
+    else:
+        context = "No relevant context found in vector database."
+    prompt = f"{INSTRUCTIONS}\n{context}\n\nQuery: {query}"
+    return PackedPrompt(
+        prompt=prompt,
+        prompt_tokens=approx_token_count(prompt),
+        context_tokens=approx_token_count(context),
+        passages_used=len(blocks),
+        passages_trimmed=trimmed,
+        passages_dropped=dropped,
+        sources=sources,
+    )
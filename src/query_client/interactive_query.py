@@ -1,24 +1,77 @@
+import argparse
+import json
+import sys
+import time
+
 import requests
 
 RETRIEVER_URL = "http://retriever:8000/retrieve"
 LLM_URL = "http://llm:8001/query"
+LLM_STREAM_URL = "http://llm:8001/query/stream"
+
+
+def ask(user_input):
+    #get context from retrieval
+    retriever_resp = requests.post(RETRIEVER_URL, json={"user_query": user_input, "top_k": 5})
+    retriever_resp.raise_for_status()
+    context = retriever_resp.json().get("context", "")
+
+    #send query and context to llm
+    llm_resp = requests.post(LLM_URL, json={"query": user_input, "context": context})
+    llm_resp.raise_for_status()
+    answer = llm_resp.json().get("answer", "")
+    print(f"\nLLM Answer:\n{answer}")
+
+
+def ask_stream(user_input):
+    """Print the answer token by token from the LLM's server-sent events."""
+    start = time.perf_counter()
+    first_token = None
+    print("\nLLM Answer:")
+    with requests.post(LLM_STREAM_URL, json={"query": user_input, "top_k": 5}, stream=True) as resp:
+        resp.raise_for_status()
+        event = None
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line:
+                event = None
+                continue
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+                continue
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[len("data:"):])
+            if event == "error":
+                print(f"\n[error] {data.get('detail')}")
+            elif event == "done":
+                if first_token is None:
+                    print("\n\n[no tokens received]")
+                    continue
+                server_ttft = data.get("ttft_ms")
+                server = f" (server {server_ttft:.0f} ms)" if server_ttft is not None else ""
+                total = (time.perf_counter() - start) * 1000
+                print(f"\n\n[time to first token {first_token * 1000:.0f} ms{server}, total {total:.0f} ms]")
+            else:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                sys.stdout.write(data["token"])
+                sys.stdout.flush()
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Interactive FinWhiz query client")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for the full answer instead of streaming")
+    args = parser.parse_args()
+
     while True:
         user_input = input("\nEnter your query (or 'exit' to quit): ")
         if user_input.lower() == "exit":
             break
 
-        #get context from retrieval
-        retriever_resp = requests.post(RETRIEVER_URL, json={"user_query": user_input, "top_k": 5})
-        retriever_resp.raise_for_status()
-        context = retriever_resp.json().get("context", "")
-
-        #send query and context to llm
-        llm_resp = requests.post(LLM_URL, json={"query": user_input, "context": context})
-        llm_resp.raise_for_status()
-        answer = llm_resp.json().get("answer", "")
-        print(f"\nLLM Answer:\n{answer}")
+        if args.no_stream:
+            ask(user_input)
+        else:
+            ask_stream(user_input)
 
 if __name__ == "__main__":
     main()
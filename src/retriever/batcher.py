@@ -0,0 +1,121 @@
+import asyncio
+import logging
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent async requests into batches for a blocking handler.
+
+    Callers `await submit(item)`. A single worker task gathers items until
+    either `max_batch_size` are queued or `max_wait_ms` has passed since the
+    first one arrived, then runs `process_batch(items)` in the default thread
+    pool and resolves each caller's future with its entry of the returned list.
+    If the batch raises, its items are retried one at a time so a single bad
+    request only fails its own caller.
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait_ms=5.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.isolated_failures = 0
+        self._queue = None
+        self._loop = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            # A queue is bound to its event loop; only a new loop gets a new one, so items
+            # still queued when a worker died are picked up by its replacement
+            self._queue = asyncio.Queue()
+            self._loop = loop
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            self.batches += 1
+            self.items += len(items)
+            self.largest_batch = max(self.largest_batch, len(items))
+            try:
+                results = await loop.run_in_executor(None, self.process_batch, items)
+            except Exception as e:
+                if len(batch) == 1:
+                    _resolve(batch[0][1], error=e)
+                    continue
+                logging.error(f"Batch of {len(items)} failed ({e}); retrying its items one at a time")
+                await self._run_each(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                _resolve(future, result)
+
+    async def _run_each(self, batch):
+        loop = asyncio.get_running_loop()
+        for item, future in batch:
+            if future.done():
+                continue
+            try:
+                (result,) = await loop.run_in_executor(None, self.process_batch, [item])
+            except Exception as e:
+                self.isolated_failures += 1
+                _resolve(future, error=e)
+            else:
+                _resolve(future, result)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "isolated_failures": self.isolated_failures,
+        }
+
+
+def _resolve(future, result=None, error=None):
+    # The caller may have gone away (cancelled) while its batch ran
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
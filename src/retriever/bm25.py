@@ -0,0 +1,108 @@
+"""
+Read side of the BM25 keyword index built by src/embedder/bm25_index.py.
+
+Postings are stored CSR-style with precomputed BM25 weights, so scoring a
+query is one scatter-add per query term. Per-document authority, doctype and
+year arrays let the sparse leg apply the same filters as Chroma.
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+# The index was built with this tokenizer, so queries must be tokenized the same way
+from ..embedder.bm25_index import tokenize
+
+# Form, box, schedule and rule references are exact-term lookups that dense retrieval handles poorly
+KEYWORD_QUERY_RE = re.compile(
+    r"\b(form|pub(lication)?|schedule|box|code|line|section|rule|topic|notice)\s*[a-z]?[-\d]+[a-z]?\b",
+    re.IGNORECASE,
+)
+# A bare number ("1099-K", "8962") only counts when it is the whole query; in a question it is
+# usually a year or a plan name ("limit for 2024", "my 401(k)")
+CODE_RE = re.compile(r"\b\d{3,5}(-[a-z]{1,3})?\b", re.IGNORECASE)
+
+
+def is_keyword_query(query, max_extra_tokens=2):
+    """Queries that are little more than a form/box/code reference can be answered from the sparse index alone."""
+    rest = KEYWORD_QUERY_RE.sub(" ", query)
+    if rest != query:
+        return len(tokenize(rest)) <= max_extra_tokens
+    rest = CODE_RE.sub(" ", query)
+    return rest != query and not tokenize(rest)
+
+
+def rrf_fuse(rankings, k=60):
+    """Reciprocal rank fusion of several ranked id lists; returns [(id, score)] best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "ids.json"), encoding="utf-8") as f:
+            self.ids = json.load(f)
+        arrays = np.load(os.path.join(path, "index.npz"))
+        self.offsets = arrays["offsets"]
+        self.docs = arrays["docs"]
+        self.weights = arrays["weights"]
+        self.authority = arrays["authority"]
+        self.doctype = arrays["doctype"]
+        self.year = arrays["year"]
+        self.authority_codes = {a: i for i, a in enumerate(self.meta["authorities"])}
+        self.doctype_codes = {d: i for i, d in enumerate(self.meta["doctypes"])}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _mask(self, authority=None, doctype=None, year_min=None, year_max=None):
+        mask = None
+
+        def narrow(m):
+            return m if mask is None else mask & m
+
+        if authority:
+            codes = [self.authority_codes.get(a, -1) for a in _as_list(authority)]
+            mask = narrow(np.isin(self.authority, codes))
+        if doctype:
+            codes = [self.doctype_codes.get(d, -1) for d in _as_list(doctype)]
+            mask = narrow(np.isin(self.doctype, codes))
+        if year_min is not None:
+            mask = narrow(self.year >= year_min)
+        if year_max is not None:
+            mask = narrow(self.year <= year_max)
+        return mask
+
+    def search(self, query, top_k=10, authority=None, doctype=None, year_min=None, year_max=None):
+        """Return [(chunk_id, score)] for the best `top_k` matches, best first."""
+        terms = [self.term_ids[t] for t in set(tokenize(query)) if t in self.term_ids]
+        if not terms or not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for t in terms:
+            lo, hi = self.offsets[t], self.offsets[t + 1]
+            # A term lists each document once, so plain fancy-index addition is safe
+            scores[self.docs[lo:hi]] += self.weights[lo:hi]
+
+        mask = self._mask(authority, doctype, year_min, year_max)
+        if mask is not None:
+            scores[~mask] = 0.0
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(scores[hits], -top_k)[-top_k:]]
+        hits = hits[np.argsort(scores[hits])[::-1]]
+        return [(self.ids[d], float(scores[d])) for d in hits]
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
@@ -0,0 +1,54 @@
+import numpy as np
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def dedup_select(candidate_embs, k, threshold=0.95):
+    """
+    Keep candidates in their given order, dropping any whose cosine similarity
+    to an already-kept candidate reaches `threshold`. Returns kept indices.
+    """
+    if len(candidate_embs) == 0:
+        return []
+    emb = _normalize(candidate_embs)
+    sim = emb @ emb.T
+    keep = []
+    alive = np.ones(len(emb), dtype=bool)
+    for i in range(len(emb)):
+        if not alive[i]:
+            continue
+        keep.append(i)
+        if len(keep) == k:
+            break
+        alive &= sim[i] < threshold
+    return keep
+
+
+def mmr_select(query_emb, candidate_embs, k, lambda_=0.7, threshold=None):
+    """
+    Greedy maximal marginal relevance over the candidate matrix: each step
+    picks the candidate maximising lambda * sim(query) - (1 - lambda) * max
+    sim(selected). Candidates at or above `threshold` similarity to a selected
+    one are dropped outright. Returns selected indices, best first.
+    """
+    if len(candidate_embs) == 0:
+        return []
+    emb = _normalize(candidate_embs)
+    relevance = emb @ _normalize(query_emb)
+    sim = emb @ emb.T
+    redundancy = np.zeros(len(emb), dtype=np.float32)
+    alive = np.ones(len(emb), dtype=bool)
+    selected = []
+    while len(selected) < k and alive.any():
+        score = np.where(alive, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(score))
+        selected.append(best)
+        alive[best] = False
+        redundancy = np.maximum(redundancy, sim[best])
+        if threshold is not None:
+            alive &= redundancy < threshold
+    return selected
@@ -0,0 +1,109 @@
+import logging
+import re
+
+# Separator between the base collection name and the partition key
+PARTITION_SEP = "__"
+
+
+def build_where(authority=None, doctype=None, year_min=None, year_max=None, where=None):
+    """Translate filter parameters into a Chroma `where` clause (None when unfiltered)."""
+    clauses = []
+    if authority:
+        clauses.append({"authority": _eq_or_in(authority)})
+    if doctype:
+        clauses.append({"doctype": _eq_or_in(doctype)})
+    if year_min is not None:
+        clauses.append({"year": {"$gte": year_min}})
+    if year_max is not None:
+        clauses.append({"year": {"$lte": year_max}})
+    if where:
+        clauses.append(where)
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _eq_or_in(value):
+    if isinstance(value, (list, tuple)):
+        return {"$in": list(value)} if len(value) > 1 else {"$eq": value[0]}
+    return {"$eq": value}
+
+
+def partition_name(base, authority):
+    """Chroma-safe collection name holding only `authority`'s chunks."""
+    slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", authority).strip("-._")
+    return f"{base}{PARTITION_SEP}{slug}"
+
+
+class PartitionIndex:
+    """
+    Per-authority copies of the main collection, so an authority-filtered
+    search scans only that authority's vectors instead of post-filtering the
+    whole HNSW graph. Each partition records the main collection's count and
+    `ingested_at` stamp it was built from, and is rebuilt when either changes
+    (an upsert-only re-ingest keeps the count but moves the stamp).
+    """
+
+    def __init__(self, client, base_collection, authorities, page_size=5000):
+        self.client = client
+        self.base = base_collection
+        self.page_size = page_size
+        self.partitions = {}
+        for authority in authorities:
+            self.partitions[authority] = self._ensure(authority)
+
+    def _ensure(self, authority):
+        name = partition_name(self.base.name, authority)
+        source_count = self.base.count()
+        source_ingested_at = (self.base.metadata or {}).get("ingested_at", "")
+        partition = self.client.get_or_create_collection(
+            name, metadata={**_plain(self.base.metadata), "partition_of": self.base.name, "authority": authority}
+        )
+        built_from = partition.metadata or {}
+        if built_from.get("source_count") == source_count and \
+                built_from.get("source_ingested_at") == source_ingested_at:
+            logging.info(f"Partition '{name}' up to date ({partition.count()} chunks)")
+            return partition
+
+        logging.info(f"Building partition '{name}' from '{self.base.name}'")
+        existing = partition.get(include=[])["ids"]
+        if existing:
+            partition.delete(ids=existing)
+        offset = 0
+        while True:
+            page = self.base.get(
+                where={"authority": authority},
+                limit=self.page_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"],
+            )
+            if not page["ids"]:
+                break
+            partition.upsert(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                documents=page["documents"],
+                metadatas=page["metadatas"],
+            )
+            offset += len(page["ids"])
+        partition.modify(metadata={
+            **_plain(partition.metadata), "source_count": source_count, "source_ingested_at": source_ingested_at,
+        })
+        logging.info(f"Partition '{name}' holds {partition.count()} chunks")
+        return partition
+
+    def route(self, authority=None, doctype=None, year_min=None, year_max=None, where=None):
+        """Pick the smallest collection that can answer the filter, and the `where` left to apply."""
+        if isinstance(authority, (list, tuple)) and len(authority) == 1:
+            authority = authority[0]
+        if isinstance(authority, str) and authority in self.partitions:
+            return self.partitions[authority], build_where(None, doctype, year_min, year_max, where)
+        return self.base, build_where(authority, doctype, year_min, year_max, where)
+
+    def stats(self):
+        return {authority: p.count() for authority, p in self.partitions.items()}
+
+
+def _plain(metadata):
+    # HNSW settings cannot be changed after creation, so only carry the plain keys over
+    return {k: v for k, v in (metadata or {}).items() if not k.startswith("hnsw:")}
@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    """Collapse case and whitespace so trivially different queries share a key."""
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings with TTL eviction.
+
+    Entries are keyed on (model, task, normalized query). When `disk_path` is
+    set, every entry is also written to a small SQLite store so the cache
+    survives container restarts; memory misses fall through to disk. Once the
+    store passes `max_disk_entries` it is pruned back to 90% of that, oldest
+    entries first, so a long-running process does not grow it unbounded.
+    """
+
+    def __init__(self, max_size=2048, ttl_seconds=86400, disk_path=None, max_disk_entries=100000):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_rows = 0  # upper bound: replaced keys are counted as new rows
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "key TEXT PRIMARY KEY, created REAL NOT NULL, dtype TEXT NOT NULL, vec BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_created ON query_embeddings(created)")
+        self._prune_disk()
+        logging.info(f"Query embedding cache spilling to {path}")
+
+    @staticmethod
+    def make_key(query, model, task):
+        raw = f"{model}\x1f{task}\x1f{normalize_query(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created):
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def get(self, query, model, task):
+        key = self.make_key(query, model, task)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, emb = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return emb
+                del self._entries[key]
+
+            emb = self._read_disk(key)
+            if emb is not None:
+                self.disk_hits += 1
+                self._insert(key, emb, time.time())
+                return emb
+
+            self.misses += 1
+            return None
+
+    def put(self, query, model, task, embedding):
+        key = self.make_key(query, model, task)
+        emb = np.asarray(embedding, dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            self._insert(key, emb, now)
+            self._write_disk(key, emb, now)
+
+    def _insert(self, key, emb, created):
+        self._entries[key] = (created, emb)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT created, dtype, vec FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        created, dtype, blob = row
+        if self._expired(created):
+            self._db.execute("DELETE FROM query_embeddings WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        return np.frombuffer(blob, dtype=dtype).copy()
+
+    def _write_disk(self, key, emb, created):
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO query_embeddings (key, created, dtype, vec) VALUES (?, ?, ?, ?)",
+            (key, created, emb.dtype.str, emb.tobytes()),
+        )
+        self._db.commit()
+        self._disk_rows += 1
+        if self._disk_rows > self.max_disk_entries:
+            # Prune below the cap so the next inserts do not each trigger a prune
+            self._prune_disk(keep=int(self.max_disk_entries * 0.9))
+
+    def _prune_disk(self, keep=None):
+        if self.ttl_seconds is not None:
+            self._db.execute("DELETE FROM query_embeddings WHERE created < ?", (time.time() - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM query_embeddings WHERE key NOT IN "
+            "(SELECT key FROM query_embeddings ORDER BY created DESC LIMIT ?)",
+            (self.max_disk_entries if keep is None else keep,),
+        )
+        self._db.commit()
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+                self._disk_rows = 0
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .query_cache import normalize_query
+
+
+class Reranker:
+    """
+    Cross-encoder rerank stage with a per-(query, chunk) score cache.
+
+    Candidates are scored in batches in their retrieval order; once the
+    deadline passes, the remaining candidates are left unscored and keep
+    their retrieval order behind the scored ones.
+    """
+
+    def __init__(self, model_name, batch_size=16, cache_size=20000, max_length=512):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.max_length = max_length
+        self.model = None
+        self.cache_hits = 0
+        self.scored = 0
+        self.deadline_stops = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load_model(self):
+        if self.model is not None:
+            return
+        with self._lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+
+                logging.info(f"Loading cross-encoder {self.model_name}...")
+                self.model = CrossEncoder(self.model_name, device="cpu", max_length=self.max_length)
+
+    def warm_up(self):
+        """Load the cross-encoder and run one forward pass so the first reranked request does not pay for it."""
+        self._load_model()
+        self.model.predict([("warm up", "warm up")], batch_size=1)
+
+    def _cached(self, key):
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, key, score):
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query, ids, documents, deadline_ms=None):
+        """
+        Return (order, scores, complete): `order` indexes into the candidates
+        best first, `scores` holds each candidate's score or None if the
+        deadline stopped scoring before reaching it. `deadline_ms=None` means no
+        deadline; 0 scores nothing new (cached scores are still used).
+        """
+        deadline = time.perf_counter() + deadline_ms / 1000.0 if deadline_ms is not None else None
+        qkey = normalize_query(query)
+        scores = [self._cached((qkey, cid)) for cid in ids]
+        self.cache_hits += sum(s is not None for s in scores)
+        pending = [i for i, s in enumerate(scores) if s is None]
+
+        complete = True
+        for start in range(0, len(pending), self.batch_size):
+            if deadline is not None and time.perf_counter() >= deadline:
+                complete = False
+                self.deadline_stops += 1
+                break
+            self._load_model()
+            batch = pending[start:start + self.batch_size]
+            batch_scores = self.model.predict([(query, documents[i]) for i in batch], batch_size=self.batch_size)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self._store((qkey, ids[i]), scores[i])
+            self.scored += len(batch)
+
+        scored = sorted((i for i, s in enumerate(scores) if s is not None), key=lambda i: scores[i], reverse=True)
+        unscored = [i for i, s in enumerate(scores) if s is None]
+        return scored + unscored, scores, complete
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "scored": self.scored,
+            "cache_hits": self.cache_hits,
+            "cache_size": len(self._cache),
+            "deadline_stops": self.deadline_stops,
+        }
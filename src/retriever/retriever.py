@@ -1,7 +1,13 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from .retriever_module import Retriever  # Your retriever class (ChromaDB + embeddings)
+from typing import Any, Dict, List, Literal, Optional, Union
+from .retriever_module import Retriever, SearchRequest  # Your retriever class (ChromaDB + embeddings)
+from .batcher import MicroBatcher
+import asyncio
 import logging
+import os
 
 logging.basicConfig(
     level=logging.INFO,
@@ -10,15 +16,133 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-app = FastAPI()
+# Micro-batching window for concurrent /retrieve calls
+RETRIEVE_BATCH_SIZE = int(os.getenv("RETRIEVE_BATCH_SIZE", "32"))
+RETRIEVE_BATCH_WAIT_MS = float(os.getenv("RETRIEVE_BATCH_WAIT_MS", "5"))
+# Warm the model at startup: "background" serves /healthz while warming, "blocking" waits, "off" stays lazy
+RETRIEVER_WARMUP = os.getenv("RETRIEVER_WARMUP", "background")
+
 r = Retriever()
+batcher = MicroBatcher(
+    r.search_batch,
+    max_batch_size=RETRIEVE_BATCH_SIZE,
+    max_wait_ms=RETRIEVE_BATCH_WAIT_MS,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    warmup = None
+    if RETRIEVER_WARMUP == "blocking":
+        await loop.run_in_executor(None, r.warm_up)
+    elif RETRIEVER_WARMUP == "background":
+        warmup = loop.run_in_executor(None, r.warm_up)
+    else:
+        r.ready = True
+    yield
+    if warmup is not None:
+        await warmup
+    await batcher.close()
+
+app = FastAPI(lifespan=lifespan)
 
 class Query(BaseModel):
     user_query: str
     top_k: int = 5
+    authority: Optional[Union[str, List[str]]] = None  # e.g. "irs.gov"
+    doctype: Optional[Union[str, List[str]]] = None  # e.g. "publication"
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    mode: Optional[Literal["dense", "sparse", "hybrid"]] = None  # default RETRIEVAL_MODE
+    rerank: Optional[bool] = None  # default RERANK_DEFAULT
+    rerank_candidates: Optional[int] = None  # candidates scored by the cross-encoder
+    rerank_deadline_ms: Optional[float] = None  # stop scoring after this long
+    diversify: Optional[Literal["dedup", "mmr", "off"]] = None  # default DIVERSIFY_DEFAULT
+    dedup_threshold: Optional[float] = None  # cosine similarity treated as a duplicate
+    mmr_lambda: Optional[float] = None  # relevance vs. diversity trade-off for "mmr"
+    include_embedding: bool = False  # return the query embedding with /search results
+
+    def to_request(self):
+        filters = {k: v for k, v in self.search_filters().items() if v is not None}
+        return SearchRequest(
+            self.user_query,
+            self.top_k,
+            filters,
+            self.mode,
+            rerank=self.rerank,
+            rerank_candidates=self.rerank_candidates,
+            rerank_deadline_ms=self.rerank_deadline_ms,
+            diversify=self.diversify,
+            dedup_threshold=self.dedup_threshold,
+            mmr_lambda=self.mmr_lambda,
+            include_embedding=self.include_embedding,
+        )
+
+    def search_filters(self):
+        return {
+            "authority": self.authority,
+            "doctype": self.doctype,
+            "year_min": self.year_min,
+            "year_max": self.year_max,
+        }
+
+class BatchQueryItem(Query):
+    filters: Optional[Dict[str, Any]] = None  # extra raw Chroma `where` clause
+
+    def search_filters(self):
+        return {**super().search_filters(), "where": self.filters}
+
+class BatchQuery(BaseModel):
+    queries: List[BatchQueryItem]
 
 @app.post("/retrieve")
-def retrieve(query: Query):
-    context = r.retrieve(query.user_query, top_k = query.top_k)
+async def retrieve(query: Query):
+    result = await batcher.submit(query.to_request())
+    context = Retriever._format_context(result["documents"])
     logger.info(f"Retrieved {len(context)} results for query.")
     return {"context": context}
+
+
+@app.post("/search")
+async def search(query: Query):
+    """Structured results for one query, micro-batched like /retrieve, tagged with the collection version."""
+    result = await batcher.submit(query.to_request())
+    return {"user_query": query.user_query, **result, "collection_version": r.collection_version}
+
+
+@app.post("/retrieve/batch")
+def retrieve_batch(batch: BatchQuery):
+    results = r.search_batch([q.to_request() for q in batch.queries])
+    logger.info(f"Retrieved results for batch of {len(results)} queries.")
+    return {
+        "results": [
+            {"user_query": q.user_query, **result}
+            for q, result in zip(batch.queries, results)
+        ],
+        "collection_version": r.collection_version,
+    }
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "timings": r.timings}
+
+
+@app.get("/readyz")
+def readyz():
+    body = {"ready": r.ready, "timings": r.timings}
+    if r.warmup_error:
+        body["error"] = r.warmup_error
+    return JSONResponse(body, status_code=200 if r.ready else 503)
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "query_cache": r.query_cache.stats(),
+        "batcher": batcher.stats(),
+        "partitions": r.partitions.stats(),
+        "latency": r.latency.stats(),
+        "rerank": r.reranker.stats(),
+        "retrieval_modes": dict(r.counters),
+    }
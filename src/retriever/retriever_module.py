@@ -1,10 +1,33 @@
 import os
+import json
+import hashlib
 import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from typing import Optional
+import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb import PersistentClient
 from .sync_chroma import download_chroma_from_gcs  # adjust import
+from .query_cache import QueryEmbeddingCache
+from .filters import PartitionIndex
+from .bm25 import BM25Index, is_keyword_query, rrf_fuse
+from .diversify import dedup_select, mmr_select
+from .latency import LatencyTracker
+from .rerank import Reranker
+# The embedder's modules are the single copy of model loading, pooling and Matryoshka truncation
+# (so query vectors are computed exactly as the ingested ones were) and of the embedding store format
+from ..embedder.backends import (
+    EMBEDDING_BACKEND,
+    FULL_DIM,
+    collection_dim,
+    load_backend,
+    validate_dim,
+)
+from ..embedder.embedding_store import MANIFEST, EmbeddingStore
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -14,49 +37,395 @@ COLLECTION_DIR = "1a90eda1-e932-4e73-89dd-edb1adf9d126"
 COLLECTION_NAME = "finwhiz_docs"
 GCS_BUCKET = os.getenv("GCS_BUCKET")
 GCS_PREFIX = "chroma_storage_backup"  # match your GCS folder name
+EMBEDDING_MODEL = "jinaai/jina-embeddings-v3"
+# Cache key for query embeddings; quantized backends produce slightly different vectors
+MODEL_ID = f"{EMBEDDING_MODEL}:{EMBEDDING_BACKEND}"
+QUERY_TASK = "retrieval.passage"
+# Unset: use the width recorded on the collection at ingest time
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM")) if os.getenv("EMBEDDING_DIM") else None
+
+# Query embedding cache: size in entries, TTL in seconds, optional SQLite spill path
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "86400"))
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH")
+# Embedder's on-disk store; preferred over the GCS download when no local Chroma exists
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "/app/src/embedding_store")
+# Authorities that get their own pre-filtered collection; comma separated, empty disables
+FILTER_PARTITIONS = [a.strip() for a in os.getenv("FILTER_PARTITIONS", "irs.gov,consumerfinance.gov").split(",") if a.strip()]
+# Hybrid retrieval: BM25 index written by the embedder, default mode and per-leg depth fused by RRF
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "/app/src/bm25_index")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Optional cross-encoder rerank: default on/off, candidates over-fetched and scoring deadline
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_DEFAULT = os.getenv("RERANK_DEFAULT", "0") == "1"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_DEADLINE_MS = float(os.getenv("RERANK_DEADLINE_MS", "150"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+# Near-duplicate suppression: "dedup", "mmr" or "off"; candidate pool is DIVERSIFY_FETCH x top_k
+DIVERSIFY_DEFAULT = os.getenv("DIVERSIFY_DEFAULT", "dedup")
+DIVERSIFY_FETCH = int(os.getenv("DIVERSIFY_FETCH", "2"))
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.95"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+
+WARMUP_QUERY = "What is the difference between a Roth IRA and a traditional IRA?"
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances")
+# Per-candidate lists that must stay aligned when results are reordered or cut
+RANKED_FIELDS = RESULT_FIELDS + ("scores", "rerank_scores")
+
+
+@dataclass
+class SearchRequest:
+    query: str
+    top_k: int = 5
+    # authority, doctype, year_min, year_max and a raw Chroma `where`
+    filters: dict = field(default_factory=dict)
+    # "dense", "sparse" or "hybrid"; None uses RETRIEVAL_MODE
+    mode: Optional[str] = None
+    # None falls back to RERANK_DEFAULT / RERANK_CANDIDATES / RERANK_DEADLINE_MS
+    rerank: Optional[bool] = None
+    rerank_candidates: Optional[int] = None
+    rerank_deadline_ms: Optional[float] = None
+    # "dedup", "mmr" or "off"; None uses DIVERSIFY_DEFAULT
+    diversify: Optional[str] = None
+    dedup_threshold: Optional[float] = None
+    mmr_lambda: Optional[float] = None
+    # Return the query embedding with the result (used by the LLM's semantic answer cache)
+    include_embedding: bool = False
 
 
 class Retriever:
     def __init__(self):
+        self.timings = {}
+        self.ready = False
+        self.warmup_error = None
+        self._model_lock = threading.Lock()
+        init_start = time.perf_counter()
+
         logging.info(f"GCS_BUCKET={GCS_BUCKET}")
         logging.info(f"CHROMA_PATH exists? {os.path.exists(CHROMA_PATH)}")
 
-        # Ensure DB is downloaded
+        # Ensure DB is downloaded, or rebuilt from the local embedding store if there is one
+        store = None
         if not os.path.exists(CHROMA_PATH) or not os.listdir(CHROMA_PATH):
-            logging.info("Downloading Chroma database from GCS")
-            download_chroma_from_gcs(GCS_BUCKET, GCS_PREFIX, COLLECTION_DIR, CHROMA_PATH)
+            if os.path.exists(os.path.join(EMBEDDING_STORE_PATH, MANIFEST)):
+                store = EmbeddingStore(EMBEDDING_STORE_PATH)
+            else:
+                logging.info("Downloading Chroma database from GCS")
+                download_chroma_from_gcs(GCS_BUCKET, GCS_PREFIX, COLLECTION_DIR, CHROMA_PATH)
         else:
             logging.info("Found local Chroma storage.")
 
         # Initialize Chroma
         logging.info("Initializing ChromaDB client")
         self.client = PersistentClient(path=CHROMA_PATH)
-        self.collection = self.client.get_or_create_collection(COLLECTION_NAME)
+        if store is not None:
+            logging.info(f"Rebuilding Chroma from embedding store at {EMBEDDING_STORE_PATH}")
+            self.collection = self.client.get_or_create_collection(
+                COLLECTION_NAME, metadata={"embedding_dim": store.dim}
+            )
+            store.rebuild_collection(self.collection)
+        else:
+            self.collection = self.client.get_or_create_collection(COLLECTION_NAME)
+        self.partitions = PartitionIndex(self.client, self.collection, FILTER_PARTITIONS)
+        self.embedding_dim = self._resolve_dim()
+        self.model_id = f"{MODEL_ID}:{self.embedding_dim}"
+        self.collection_version = self._collection_version()
         self.embedder = None
+        self.query_cache = QueryEmbeddingCache(
+            max_size=QUERY_CACHE_SIZE,
+            ttl_seconds=QUERY_CACHE_TTL,
+            disk_path=QUERY_CACHE_PATH,
+        )
+        self.bm25 = None
+        if os.path.exists(os.path.join(BM25_INDEX_PATH, "meta.json")):
+            self.bm25 = BM25Index(BM25_INDEX_PATH)
+            logging.info(f"Loaded BM25 index over {len(self.bm25)} chunks")
+        self.latency = LatencyTracker()
+        self.reranker = Reranker(RERANK_MODEL, batch_size=RERANK_BATCH_SIZE)
+        self.counters = Counter()
+        self.timings["chroma_init_s"] = time.perf_counter() - init_start
+
+    def _resolve_dim(self):
+        """Query width must match the collection; refuse to start on a mismatch."""
+        stored = collection_dim(self.collection)
+        if EMBEDDING_DIM is not None and stored is not None and EMBEDDING_DIM != stored:
+            raise ValueError(
+                f"EMBEDDING_DIM={EMBEDDING_DIM} but collection '{COLLECTION_NAME}' holds {stored}-d embeddings"
+            )
+        dim = validate_dim(EMBEDDING_DIM or stored or FULL_DIM)
+        logging.info(f"Using {dim}-d query embeddings")
+        return dim
+
+    def _collection_version(self):
+        """Changes whenever the embedding model, chunk count or last ingest time changes."""
+        ingested_at = (self.collection.metadata or {}).get("ingested_at", "")
+        key = f"{self.model_id}|{self.collection.count()}|{ingested_at}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
 
     def _load_model(self):
-        if self.embedder is None:
+        if self.embedder is not None:
+            return
+        # Concurrent first requests must not each load their own copy of the model
+        with self._model_lock:
+            if self.embedder is not None:
+                return
             logging.info("Loading Jina embedding model...")
-            self.embedder = SentenceTransformer(
-                "jinaai/jina-embeddings-v3", 
-                device="cpu", 
-                trust_remote_code=True
+            start = time.perf_counter()
+            self.embedder = load_backend(EMBEDDING_BACKEND, dim=self.embedding_dim)
+            self.timings["model_load_s"] = time.perf_counter() - start
+            logging.info(f"Loaded embedding model in {self.timings['model_load_s']:.1f}s")
+
+    def warm_up(self):
+        """
+        Load the model, run one forward pass and one Chroma query (and load the
+        cross-encoder if reranking is on by default), then mark ready.
+        """
+        try:
+            self._load_model()
+
+            start = time.perf_counter()
+            warm_emb = self.embedder.encode([WARMUP_QUERY], task=QUERY_TASK)
+            self.timings["warmup_encode_s"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            if self.collection.count() > 0:
+                self.collection.query(query_embeddings=warm_emb.tolist(), n_results=1)
+            self.timings["warmup_query_s"] = time.perf_counter() - start
+
+            if RERANK_DEFAULT:
+                start = time.perf_counter()
+                self.reranker.warm_up()
+                self.timings["warmup_rerank_s"] = time.perf_counter() - start
+
+            self.ready = True
+            logging.info(f"Retriever warm-up complete: {self.timings}")
+        except Exception as e:
+            self.warmup_error = str(e)
+            logging.error(f"Retriever warm-up failed: {e}")
+
+    def embed_queries(self, queries):
+        """Embed a list of queries, encoding only cache misses in a single batch."""
+        embeddings = [self.query_cache.get(q, self.model_id, QUERY_TASK) for q in queries]
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if missing:
+            self._load_model()
+            encoded = self.embedder.encode([queries[i] for i in missing], task=QUERY_TASK)
+            for i, emb in zip(missing, encoded):
+                self.query_cache.put(queries[i], self.model_id, QUERY_TASK, emb)
+                embeddings[i] = emb
+        return np.vstack(embeddings)
+
+    def embed_query(self, query):
+        return self.embed_queries([query])[0]
+
+    def _mode(self, request):
+        mode = request.mode or RETRIEVAL_MODE
+        # The sparse leg cannot evaluate arbitrary Chroma `where` clauses
+        if mode != "dense" and (self.bm25 is None or request.filters.get("where")):
+            return "dense"
+        return mode
+
+    def _dense_search(self, requests, depths):
+        """
+        Embed all queries in one batch, then run one multi-vector Chroma query
+        per (collection, remaining where) group. A single-authority filter is
+        routed to that authority's partition collection.
+        """
+        if not requests:
+            return []
+        with self.latency.time("embed"):
+            query_embs = self.embed_queries([r.query for r in requests])
+
+        groups = {}
+        for i, request in enumerate(requests):
+            collection, where = self.partitions.route(**request.filters)
+            key = (collection.name, json.dumps(where, sort_keys=True) if where else "")
+            groups.setdefault(key, (collection, where, []))[2].append(i)
+
+        results = [None] * len(requests)
+        with self.latency.time("dense"):
+            for collection, where, indices in groups.values():
+                response = collection.query(
+                    query_embeddings=query_embs[indices].tolist(),
+                    n_results=max(depths[i] for i in indices),
+                    where=where,
+                    include=["documents", "metadatas", "distances"],
+                )
+                for row, i in enumerate(indices):
+                    results[i] = {
+                        f: (response.get(f) or [[]] * len(indices))[row][:depths[i]] for f in RESULT_FIELDS
+                    }
+        return results
+
+    def _sparse_search(self, request, depth):
+        filters = {k: v for k, v in request.filters.items() if k != "where"}
+        with self.latency.time("sparse"):
+            return self.bm25.search(request.query, top_k=depth, **filters)
+
+    def search_batch(self, requests):
+        """
+        Run a batch of SearchRequests. Requests that rerank or diversify
+        over-fetch candidates; the rerank cuts them to the diversify pool and
+        diversification cuts that to at most top_k distinct passages.
+        """
+        reranked = [r.rerank if r.rerank is not None else RERANK_DEFAULT for r in requests]
+        diversify = [(r.diversify or DIVERSIFY_DEFAULT) for r in requests]
+        pools = [r.top_k * DIVERSIFY_FETCH if d != "off" else r.top_k for r, d in zip(requests, diversify)]
+        fetch = [
+            replace(r, top_k=max(pool, r.rerank_candidates or RERANK_CANDIDATES) if rr else pool)
+            for r, rr, pool in zip(requests, reranked, pools)
+        ]
+        results = self._search_candidates(fetch)
+        for request, result, rr, pool in zip(requests, results, reranked, pools):
+            if rr:
+                self._rerank(request, result, pool)
+        self._diversify(requests, results, diversify)
+
+        wanted = [i for i, r in enumerate(requests) if r.include_embedding]
+        if wanted:
+            embs = self.embed_queries([requests[i].query for i in wanted])
+            for i, emb in zip(wanted, embs):
+                results[i]["query_embedding"] = emb.tolist()
+        return results
+
+    def _rerank(self, request, result, pool):
+        deadline_ms = request.rerank_deadline_ms if request.rerank_deadline_ms is not None else RERANK_DEADLINE_MS
+        with self.latency.time("rerank"):
+            order, scores, complete = self.reranker.rerank(
+                request.query, result["ids"], result["documents"], deadline_ms
             )
+        result["rerank_scores"] = scores
+        result["rerank_complete"] = complete
+        _select(result, order[:pool])
+
+    def _diversify(self, requests, results, modes):
+        """
+        Drop near-duplicate passages (overlapping chunks of the same page)
+        using the candidates' stored embeddings, fetched in one Chroma get.
+        """
+        active = [i for i, m in enumerate(modes) if m != "off" and results[i]["ids"]]
+        if not active:
+            for request, result in zip(requests, results):
+                _select(result, range(min(request.top_k, len(result["ids"]))))
+            return
+        with self.latency.time("diversify"):
+            ids = sorted({cid for i in active for cid in results[i]["ids"]})
+            page = self.collection.get(ids=ids, include=["embeddings"])
+            vectors = dict(zip(page["ids"], np.asarray(page["embeddings"], dtype=np.float32)))
+            mmr = [i for i in active if modes[i] == "mmr"]
+            query_embs = dict(zip(mmr, self.embed_queries([requests[i].query for i in mmr]))) if mmr else {}
+
+            for i, (request, result) in enumerate(zip(requests, results)):
+                if i not in active:
+                    _select(result, range(min(request.top_k, len(result["ids"]))))
+                    continue
+                rows = [k for k, cid in enumerate(result["ids"]) if cid in vectors]
+                if not rows:
+                    # No hits, or none of them still in the collection: nothing to compare
+                    _select(result, range(min(request.top_k, len(result["ids"]))))
+                    continue
+                embs = np.stack([vectors[result["ids"][k]] for k in rows])
+                threshold = request.dedup_threshold if request.dedup_threshold is not None else DEDUP_THRESHOLD
+                if modes[i] == "mmr":
+                    lambda_ = request.mmr_lambda if request.mmr_lambda is not None else MMR_LAMBDA
+                    picked = mmr_select(query_embs[i], embs, request.top_k, lambda_, threshold)
+                else:
+                    picked = dedup_select(embs, request.top_k, threshold)
+                _select(result, [rows[k] for k in picked])
+                result["diversify"] = modes[i]
 
-    def retrieve(self, query, top_k=5):
-        self._load_model()
-        logging.info(f"Querying with: {query}")
+    def _search_candidates(self, requests):
+        """
+        Run a batch of SearchRequests and return one dict per request with the
+        structured ids, documents, metadatas and distances.
 
-        query_emb = self.embedder.encode(query, task="retrieval.passage", convert_to_numpy=True)
-        if query_emb.ndim == 1:
-            query_emb = [query_emb.tolist()]
+        Dense queries are embedded together and grouped into as few Chroma
+        queries as their filters allow. Hybrid requests also query the BM25
+        index and fuse both rankings with reciprocal rank fusion. Short
+        form/box/code lookups that BM25 answers fully skip the embedding call.
+        """
+        if not requests:
+            return []
+        logging.info(f"Querying batch of {len(requests)}: {[r.query for r in requests]}")
+        modes = [self._mode(r) for r in requests]
+        depths = [r.top_k if m == "dense" else max(r.top_k, HYBRID_CANDIDATES) for r, m in zip(requests, modes)]
 
-        results = self.collection.query(query_embeddings=query_emb, n_results=top_k)
-        if not results["documents"] or not results["documents"][0]:
+        sparse = [self._sparse_search(r, d) if m != "dense" else None
+                  for r, m, d in zip(requests, modes, depths)]
+        for i, request in enumerate(requests):
+            if modes[i] == "hybrid" and is_keyword_query(request.query) and len(sparse[i]) >= request.top_k:
+                modes[i] = "sparse"
+                self.counters["sparse_short_circuit"] += 1
+
+        dense_idx = [i for i, m in enumerate(modes) if m != "sparse"]
+        dense = dict(zip(dense_idx, self._dense_search([requests[i] for i in dense_idx],
+                                                       [depths[i] for i in dense_idx])))
+
+        results = []
+        for i, request in enumerate(requests):
+            self.counters[modes[i]] += 1
+            if modes[i] == "dense":
+                results.append({**dense[i], "retrieval": "dense"})
+                continue
+            if modes[i] == "sparse":
+                ranked = sparse[i][:request.top_k]
+            else:
+                with self.latency.time("fusion"):
+                    ranked = rrf_fuse([dense[i]["ids"], [cid for cid, _ in sparse[i]]], k=RRF_K)[:request.top_k]
+            known = {}
+            if i in dense:
+                known = {cid: (doc, meta, dist) for cid, doc, meta, dist in
+                         zip(*(dense[i][f] for f in RESULT_FIELDS))}
+            results.append({
+                "ids": [cid for cid, _ in ranked],
+                "scores": [score for _, score in ranked],
+                "retrieval": modes[i],
+                "_known": known,
+            })
+        self._hydrate([r for r in results if "_known" in r])
+        return results
+
+    def _hydrate(self, results):
+        """Fill documents/metadatas for ids that only the sparse leg returned, in one Chroma get."""
+        missing = sorted({cid for r in results for cid in r["ids"] if cid not in r["_known"]})
+        fetched = {}
+        if missing:
+            page = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            fetched = {cid: (doc, meta, None) for cid, doc, meta in
+                       zip(page["ids"], page["documents"], page["metadatas"])}
+        for r in results:
+            known = r.pop("_known")
+            rows = [known.get(cid) or fetched.get(cid) for cid in r["ids"]]
+            keep = [k for k, row in enumerate(rows) if row is not None]
+            r["ids"] = [r["ids"][k] for k in keep]
+            r["scores"] = [r["scores"][k] for k in keep]
+            r["documents"] = [rows[k][0] for k in keep]
+            r["metadatas"] = [rows[k][1] for k in keep]
+            r["distances"] = [rows[k][2] for k in keep]
+
+    def retrieve_many(self, requests):
+        """Answer a batch of SearchRequests with one context string per request."""
+        results = self.search_batch(requests)
+        return [self._format_context(result["documents"]) for result in results]
+
+    @staticmethod
+    def _format_context(context_info):
+        if not context_info:
             logging.warning("No context retrieved from Chroma.")
             return "No relevant context found in vector database."
-
-        context_info = results["documents"][0]
-        context_str = "\n".join(context_info)
         logging.info(f"Retrieved {len(context_info)} context documents.")
-        return context_str
+        return "\n".join(context_info)
+
+    def retrieve(self, query, top_k=5, filters=None):
+        return self.retrieve_many([SearchRequest(query, top_k, filters or {})])[0]
+
+
+def _select(result, order):
+    """Reorder and cut every per-candidate list of a result to `order`."""
+    order = list(order)
+    for f in RANKED_FIELDS:
+        if f in result:
+            result[f] = [result[f][i] for i in order]
@@ -0,0 +1,35 @@
+# test_bm25.py — run from the repo root: python -m pytest src/retriever/test_bm25.py
+import pytest
+
+from src.retriever.bm25 import is_keyword_query, rrf_fuse
+
+
+@pytest.mark.parametrize("query", [
+    "Form 1099-K",
+    "form 8962 instructions",
+    "What is rule 2111?",
+    "FINRA Rule 4512",
+    "Pub 590-A",
+    "W-2 box 12",
+    "1099-INT",
+    "8962",
+])
+def test_reference_lookups_are_keyword_queries(query):
+    assert is_keyword_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "What is the IRA contribution limit for 2024?",
+    "How does a 401(k) work?",
+    "Should I roll over my 403(b) when I change jobs?",
+    "What does Form 1099-K mean for my taxes when I sell things online?",
+    "How much should I save for retirement?",
+    "",
+])
+def test_questions_are_not_keyword_queries(query):
+    assert not is_keyword_query(query)
+
+
+def test_rrf_fuse_rewards_agreement():
+    fused = rrf_fuse([["a", "b", "c"], ["b", "c", "d"]])
+    assert [chunk_id for chunk_id, _ in fused][:2] == ["b", "c"]
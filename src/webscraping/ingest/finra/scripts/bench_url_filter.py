@@ -0,0 +1,74 @@
+"""
+Micro-benchmark for crawl scope checks: per-call pattern matching
+(within_allow/matches_deny, as the crawler used to do for every link)
+against UrlFilter, over a synthetic link set shaped like a FINRA crawl.
+
+    python -m scripts.bench_url_filter --n 1000000
+"""
+from __future__ import annotations
+import random
+import re
+import time
+from typing import List
+
+import typer
+import yaml
+
+from src.crawl.extract import within_allow, matches_deny
+from src.crawl.url_filter import UrlFilter
+
+app = typer.Typer(add_completion=False)
+
+SECTIONS = ["learn-to-invest", "investing-basics", "professional-designations", "rules-guidance",
+            "filing-reporting", "media-center", "about", "arbitration"]
+
+def synthetic_urls(n: int, distinct: int, seed: int = 0) -> List[str]:
+    """`n` links drawn from `distinct` URLs; nav/footer links repeat on every page, so the pool is skewed."""
+    rng = random.Random(seed)
+    pool = []
+    for i in range(distinct):
+        host = "www.finra.org" if rng.random() < 0.9 else rng.choice(["twitter.com", "www.sec.gov", "www.investor.gov"])
+        path = f"/investors/{rng.choice(SECTIONS)}/topic-{i}"
+        if rng.random() < 0.05:
+            path += "?page=2"
+        elif rng.random() < 0.02:
+            path += ".zip"
+        pool.append(f"https://{host}{path}")
+    weights = [1.0 / (rank + 1) for rank in range(distinct)]
+    return rng.choices(pool, weights=weights, k=n)
+
+def per_call(allow: List[str], deny: List[str]):
+    def check(url: str) -> bool:
+        # The matcher as it was: a re.compile() per pattern per URL
+        return any(re.compile(p).search(url) for p in allow) and not any(re.compile(p).search(url) for p in deny)
+    return check
+
+def timed(label: str, check, urls: List[str]) -> float:
+    start = time.perf_counter()
+    kept = sum(1 for u in urls if check(u))
+    dur = time.perf_counter() - start
+    print(f"{label:<28} {dur:7.2f}s  {len(urls) / dur / 1e6:6.2f}M URLs/s  kept={kept}")
+    return dur
+
+@app.command()
+def main(
+    seeds: str = typer.Option("config/crawl_allowlist.yml", help="Path to crawl_allowlist.yml"),
+    blocklist: str = typer.Option("config/crawl_blocklist.yml", help="Path to crawl_blocklist.yml"),
+    n: int = typer.Option(1_000_000, help="Links to check"),
+    distinct: int = typer.Option(50_000, help="Distinct URLs among them"),
+):
+    with open(seeds, "r", encoding="utf-8") as f:
+        allow = yaml.safe_load(f).get("allow", [])
+    with open(blocklist, "r", encoding="utf-8") as f:
+        deny = yaml.safe_load(f).get("deny", [])
+    urls = synthetic_urls(n, distinct)
+    print(f"{n} links, {distinct} distinct, {len(allow)} allow / {len(deny)} deny patterns")
+
+    base = timed("re.compile per call", per_call(allow, deny), urls)
+    cached = timed("within_allow/matches_deny", lambda u: within_allow(u, allow) and not matches_deny(u, deny), urls)
+    uncached = timed("UrlFilter (no verdict cache)", UrlFilter(allow, deny, cache_size=0).allowed, urls)
+    filt = timed("UrlFilter", UrlFilter(allow, deny), urls)
+    print(f"speedup vs per-call compile: {base / cached:.1f}x / {base / uncached:.1f}x / {base / filt:.1f}x")
+
+if __name__ == "__main__":
+    app()
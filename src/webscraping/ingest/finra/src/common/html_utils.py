@@ -1,30 +1,58 @@
 from __future__ import annotations
 from bs4 import BeautifulSoup
+import lxml.html
 import re
 from typing import List, Dict
+from urllib.parse import urljoin
 
 _WS = re.compile(r"\s+")
+# Text BeautifulSoup's get_text() leaves out
+_SKIP_TEXT = {"script", "style", "template"}
+_PARSER = lxml.html.HTMLParser(encoding="utf-8")
 
 def clean_text(s: str) -> str:
     s = s.replace("\xa0", " ")
     s = _WS.sub(" ", s)
     return s.strip()
 
-def extract_links(html: str, base_url: str) -> List[str]:
-    soup = BeautifulSoup(html, "lxml")
+def parse_html(html: str) -> lxml.html.HtmlElement:
+    """Parse once with lxml; parse from bytes so an encoding declaration in the markup is not an error."""
+    if not html.strip():
+        html = "<html></html>"
+    return lxml.html.document_fromstring(html.encode("utf-8"), parser=_PARSER)
+
+def _texts(el, out: List[str]) -> None:
+    if el.text:
+        out.append(el.text)
+    for child in el:
+        # Comments and processing instructions have a non-string tag; only their tail is page text
+        if isinstance(child.tag, str) and child.tag not in _SKIP_TEXT:
+            _texts(child, out)
+        if child.tail:
+            out.append(child.tail)
+
+def node_text(el) -> str:
+    """Cleaned text of an lxml element, like clean_text(tag.get_text(" ", strip=True))."""
+    parts: List[str] = []
+    _texts(el, parts)
+    return clean_text(" ".join(p.strip() for p in parts if p.strip()))
+
+def links_from_tree(root, base_url: str) -> List[str]:
     out: List[str] = []
-    for a in soup.select("a[href]"):
+    for a in root.iter("a"):
         href = a.get("href")
         if not href or href.startswith("#"):
             continue
         if href.startswith(("http://", "https://")):
             out.append(href)
         elif href.startswith("/"):
-            from urllib.parse import urljoin
             out.append(urljoin(base_url, href))
     # dedupe, preserve order
     return list(dict.fromkeys(out))
 
+def extract_links(html: str, base_url: str) -> List[str]:
+    return links_from_tree(parse_html(html), base_url)
+
 def select_texts(html: str, selectors: Dict[str, str]) -> Dict[str, List[str]]:
     soup = BeautifulSoup(html, "lxml")
     out: Dict[str, List[str]] = {}
@@ -0,0 +1,253 @@
+from __future__ import annotations
+import asyncio
+import time
+import urllib.robotparser as robotparser
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+from ..common.io_utils import sha256_of_bytes, write_gzip_bytes, write_json_gz
+from .extract import extract_page_fields
+from .frontier import Frontier
+from .state import CrawlState
+from .url_filter import UrlFilter
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `burst`."""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = max(rate, 0.01)
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostLimiter:
+    """One token bucket per host, so politeness is enforced per site rather than globally."""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    async def acquire(self, url: str) -> None:
+        host = urlparse(url).netloc
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+
+class AsyncRobots:
+    """robots.txt rules fetched once per host through the shared client."""
+    def __init__(self, client: httpx.AsyncClient, user_agent: str, limiter: Optional[HostLimiter] = None):
+        self.client = client
+        self.user_agent = user_agent
+        self.limiter = limiter
+        self._parsers: Dict[str, robotparser.RobotFileParser] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _parser_for(self, url: str) -> robotparser.RobotFileParser:
+        parts = urlparse(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        if key in self._parsers:
+            return self._parsers[key]
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            if key in self._parsers:
+                return self._parsers[key]
+            rp = robotparser.RobotFileParser(f"{key}/robots.txt")
+            try:
+                if self.limiter is not None:
+                    await self.limiter.acquire(url)
+                r = await self.client.get(f"{key}/robots.txt")
+                # Same status handling as RobotFileParser.read()
+                if r.status_code in (401, 403):
+                    rp.disallow_all = True
+                elif 400 <= r.status_code < 500:
+                    rp.allow_all = True
+                elif r.status_code < 400:
+                    rp.parse(r.text.splitlines())
+            except Exception:
+                pass  # unread rules deny everything, as with the sync robots check
+            self._parsers[key] = rp
+            return rp
+
+    async def allowed(self, url: str) -> bool:
+        rp = await self._parser_for(url)
+        try:
+            return rp.can_fetch(self.user_agent, url)
+        except Exception:
+            return False
+
+
+def process_page(content: bytes, url: str, selectors: Dict[str, str], out: str, parsed_out: str) -> Tuple[str, List[str]]:
+    """Parse and persist one page; runs in the parse worker pool. Returns (sha256, links)."""
+    sha = sha256_of_bytes(content)
+    day = time.strftime("%Y/%m/%d")
+    write_gzip_bytes(Path(out) / day / f"{sha}.html.gz", content)
+    page = extract_page_fields(content.decode("utf-8", errors="ignore"), url, selectors)
+    write_json_gz(Path(parsed_out) / f"{sha}.json.gz", page)
+    return sha, page["links"]
+
+
+class AsyncCrawler:
+    """
+    Concurrent crawl over one shared HTTP/2 client: up to `concurrency`
+    requests in flight across hosts, each host limited by its own token
+    bucket, robots.txt resolved asynchronously, and parsing offloaded to
+    `parse_executor` (a process pool in production; None uses threads).
+    """
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        allow_patterns: List[str],
+        deny_patterns: List[str],
+        selectors: Dict[str, str],
+        out: str,
+        parsed_out: str,
+        user_agent: str,
+        max_pages: int = 200,
+        concurrency: int = 16,
+        rps_per_host: float = 1.0,
+        burst: int = 1,
+        parse_executor: Optional[Executor] = None,
+        state: Optional[CrawlState] = None,
+        url_filter: Optional[UrlFilter] = None,
+    ):
+        self.client = client
+        self.url_filter = url_filter or UrlFilter(allow_patterns, deny_patterns)
+        self.selectors = selectors
+        self.out = out
+        self.parsed_out = parsed_out
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.limiter = HostLimiter(rps_per_host, burst)
+        self.robots = AsyncRobots(client, user_agent, self.limiter)
+        self.parse_executor = parse_executor
+        self.state = state
+        self.stats = {"fetched": 0, "not_modified": 0, "unchanged": 0, "skipped": 0, "errors": 0}
+        self._claimed = 0
+        self._inflight = 0
+
+    async def _get(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(3),
+            wait=wait_exponential(multiplier=0.5, max=8),
+            retry=retry_if_exception_type(httpx.TransportError),
+            reraise=True,
+        ):
+            with attempt:
+                await self.limiter.acquire(url)
+                return await self.client.get(url, headers=headers)
+
+    async def _crawl_one(self, url: str, frontier: Frontier) -> bool:
+        """Crawl one URL; returns False if it should be left in the frontier for a later run."""
+        if not self.url_filter(url) or not await self.robots.allowed(url):
+            self.stats["skipped"] += 1
+            return True
+        # Reserve a page slot before fetching so in-flight requests never overshoot max_pages
+        if self._claimed >= self.max_pages:
+            return False
+        self._claimed += 1
+        prev = self.state.get(url) if self.state is not None else None
+        try:
+            r = await self._get(url, CrawlState.conditional_headers(prev))
+        except Exception as exc:
+            print(f"Failed to fetch {url}: {exc}")
+            self.stats["errors"] += 1
+            self._claimed -= 1
+            return False
+        if r.status_code >= 500:
+            self.stats["errors"] += 1
+            self._claimed -= 1
+            return False
+        if r.status_code == 304 and prev is not None:
+            # Unchanged since the last crawl: nothing to store or transform, but keep following its links
+            self.stats["not_modified"] += 1
+            self.state.touch(url, r.status_code)
+            links = prev["links"]
+        elif r.status_code in (304, 204) or r.status_code >= 400:
+            self.stats["skipped"] += 1
+            self._claimed -= 1
+            return True
+        else:
+            sha = sha256_of_bytes(r.content)
+            if prev is not None and prev["sha256"] == sha:
+                # Server ignored the validators but the bytes are identical
+                self.stats["unchanged"] += 1
+                links = prev["links"]
+            else:
+                loop = asyncio.get_running_loop()
+                _, links = await loop.run_in_executor(
+                    self.parse_executor, process_page, r.content, url, self.selectors, self.out, self.parsed_out
+                )
+                self.stats["fetched"] += 1
+            if self.state is not None:
+                self.state.record(url, r.status_code, dict(r.headers), sha, links, changed=prev is None or prev["sha256"] != sha)
+        for link in links:
+            if self.url_filter(link):
+                frontier.push(link, parent=url)
+        return True
+
+    async def _worker(self, frontier: Frontier, ready: asyncio.Condition) -> None:
+        while True:
+            async with ready:
+                # An empty frontier is only final once no in-flight page can add links to it
+                while len(frontier) == 0 and self._inflight > 0:
+                    await ready.wait()
+                if len(frontier) == 0 or self._claimed >= self.max_pages:
+                    ready.notify_all()
+                    return
+                url = frontier.pop()
+                self._inflight += 1
+            finished = False
+            try:
+                finished = await self._crawl_one(url, frontier)
+            finally:
+                # Only fetched pages and terminal answers leave the frontier; the rest wait for a resume
+                if finished:
+                    frontier.done(url)
+                else:
+                    frontier.defer(url)
+                async with ready:
+                    self._inflight -= 1
+                    ready.notify_all()
+
+    async def run(self, seeds: List[str], frontier=None) -> Dict[str, int]:
+        """Crawl from `seeds`, or continue a (persistent) `frontier` if one is given."""
+        if frontier is None:
+            frontier = Frontier(seeds)
+        ready = asyncio.Condition()
+        self._inflight = 0
+        workers = [asyncio.create_task(self._worker(frontier, ready)) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+        return self.stats
+
+
+def make_client(user_agent: str, timeout: float = 20.0, concurrency: int = 16) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=True,
+        headers={"User-Agent": user_agent, "Accept": "text/html,application/xhtml+xml"},
+        timeout=timeout,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
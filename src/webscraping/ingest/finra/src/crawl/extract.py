@@ -1,32 +1,41 @@
 from __future__ import annotations
-import re
 from typing import Dict, List
-from bs4 import BeautifulSoup
-from ..common.html_utils import clean_text, extract_links
+from ..common.html_utils import links_from_tree, node_text, parse_html
+from ..transform.normalize import BLOCKS_VERSION, tree_to_blocks
+from .url_filter import compile_pattern
 
 def within_allow(url: str, allow_patterns: List[str]) -> bool:
-    return any(re.compile(p).search(url) for p in allow_patterns)
+    return any(compile_pattern(p).search(url) for p in allow_patterns)
 
 def matches_deny(url: str, deny_patterns: List[str]) -> bool:
-    return any(re.compile(p).search(url) for p in deny_patterns)
+    return any(compile_pattern(p).search(url) for p in deny_patterns)
+
+def _first(root, css: str):
+    found = root.cssselect(css)
+    return found[0] if found else None
 
 def extract_page_fields(html: str, url: str, selectors: Dict[str, str]) -> Dict:
-    soup = BeautifulSoup(html, "lxml")
-    title = (soup.select_one(selectors.get("title", "h1")) or soup.select_one("h1"))
-    title_text = clean_text(title.get_text(" ", strip=True)) if title else ""
+    """Fields, links and structural blocks from a single lxml parse of the page."""
+    root = parse_html(html)
+    title = _first(root, selectors.get("title", "h1"))
+    if title is None:
+        title = _first(root, "h1")
+    title_text = node_text(title) if title is not None else ""
 
-    pub_el = soup.select_one(selectors.get("publish_date", "time[datetime]"))
-    publish_date = pub_el.get("datetime") if pub_el and pub_el.has_attr("datetime") else None
-    if not publish_date and pub_el:
-        publish_date = clean_text(pub_el.get_text(" ", strip=True))
+    pub_el = _first(root, selectors.get("publish_date", "time[datetime]"))
+    publish_date = pub_el.get("datetime") if pub_el is not None else None
+    if not publish_date and pub_el is not None:
+        publish_date = node_text(pub_el)
 
-    breadcrumbs = [clean_text(el.get_text(" ", strip=True)) for el in soup.select(selectors.get("breadcrumbs", ".breadcrumb li"))]
+    breadcrumbs = [node_text(el) for el in root.cssselect(selectors.get("breadcrumbs", ".breadcrumb li"))]
 
     return {
         "url": url,
         "title": title_text,
         "publish_date": publish_date,
         "breadcrumbs": breadcrumbs,
-        "links": extract_links(html, url),
+        "links": links_from_tree(root, url),
+        "blocks": tree_to_blocks(root),
+        "blocks_version": BLOCKS_VERSION,
         "html": html,
     }
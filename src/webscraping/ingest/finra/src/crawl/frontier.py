@@ -1,6 +1,13 @@
 from __future__ import annotations
-from typing import Iterable, Set, Deque
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Set, Deque, Tuple
 from collections import deque
+from urllib.parse import urlparse
 
 class Frontier:
     """FIFO URL frontier with a seen set."""
@@ -8,7 +15,7 @@ class Frontier:
         self.queue: Deque[str] = deque(seeds)
         self.seen: Set[str] = set(seeds)
 
-    def push(self, url: str) -> None:
+    def push(self, url: str, parent: Optional[str] = None) -> None:
         if url not in self.seen:
             self.seen.add(url)
             self.queue.append(url)
@@ -16,5 +23,184 @@ class Frontier:
     def pop(self) -> str | None:
         return self.queue.popleft() if self.queue else None
 
+    def done(self, url: str) -> None:
+        pass
+
+    def defer(self, url: str) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+
+class BloomFilter:
+    """Fixed-size seen-set: memory stays flat however many URLs are added."""
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 1e-4, data: Optional[bytes] = None):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(data) if data is not None else bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> bool:
+        """Add `item`; returns False if it was (probably) already present."""
+        new = False
+        for pos in self._positions(item):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(item))
+
+
+# DEFERRED: popped but not finished (page cap reached, fetch failed); queued again on the next run
+QUEUED, INFLIGHT, DONE, DEFERRED = 0, 1, 2, 3
+
+
+class PersistentFrontier:
+    """
+    Disk-backed priority frontier with per-host queues.
+
+    URLs live in SQLite with their host, depth and priority; pop() serves
+    hosts round-robin and the highest-priority URL within a host. Priority is
+    the best matching pattern weight, minus `depth_penalty` per link hop,
+    plus up to `staleness_weight` for pages never fetched or not fetched for
+    `staleness_horizon` seconds (from the crawl-state store, if given).
+
+    A Bloom filter is the seen-set, so memory does not grow with the crawl.
+    The queue and Bloom bits are checkpointed every `checkpoint_every`
+    operations and on close; URLs in flight at a crash, and URLs deferred
+    because the page cap was hit or their fetch failed, are re-queued on
+    resume.
+    """
+    def __init__(
+        self,
+        path: str,
+        seeds: Iterable[str] = (),
+        weights: Optional[List[Dict]] = None,
+        state=None,
+        depth_penalty: float = 0.5,
+        staleness_weight: float = 1.0,
+        staleness_horizon: float = 7 * 86400,
+        capacity: int = 1_000_000,
+        checkpoint_every: int = 100,
+    ):
+        self.path = path
+        self.bloom_path = f"{path}.bloom"
+        self.weights: List[Tuple[re.Pattern, float]] = [
+            (re.compile(w["pattern"]), float(w["weight"])) for w in (weights or [])
+        ]
+        self.state = state
+        self.depth_penalty = depth_penalty
+        self.staleness_weight = staleness_weight
+        self.staleness_horizon = staleness_horizon
+        self.checkpoint_every = checkpoint_every
+        self._ops = 0
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            "url TEXT PRIMARY KEY, host TEXT, depth INTEGER, priority REAL, status INTEGER, added_at REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS frontier_host ON frontier (host, status, priority DESC)")
+        # Anything in flight when the last run died, or left for a later run, is crawled again
+        self.conn.execute("UPDATE frontier SET status = ? WHERE status IN (?, ?)", (QUEUED, INFLIGHT, DEFERRED))
+        self.conn.commit()
+
+        data = None
+        if os.path.exists(self.bloom_path):
+            with open(self.bloom_path, "rb") as f:
+                data = f.read()
+        self.seen = BloomFilter(capacity, data=data)
+        if data is None or len(data) != len(self.seen.bits):
+            self.seen = BloomFilter(capacity)
+            for (url,) in self.conn.execute("SELECT url FROM frontier"):
+                self.seen.add(url)
+
+        self.inflight: Dict[str, int] = {}
+        self.queued: Dict[str, int] = dict(
+            self.conn.execute("SELECT host, COUNT(*) FROM frontier WHERE status = ? GROUP BY host", (QUEUED,))
+        )
+        self.served: Dict[str, float] = {}
+        for url in seeds:
+            self.push(url)
+
+    def priority(self, url: str, depth: int) -> float:
+        score = max((w for p, w in self.weights if p.search(url)), default=0.0)
+        score -= self.depth_penalty * depth
+        fetched_at = self.state.fetched_at(url) if self.state is not None else None
+        age = time.time() - fetched_at if fetched_at else self.staleness_horizon
+        return score + self.staleness_weight * min(age / self.staleness_horizon, 1.0)
+
+    def push(self, url: str, parent: Optional[str] = None) -> None:
+        if not self.seen.add(url):
+            return
+        depth = self.inflight.get(parent, -1) + 1 if parent else 0
+        host = urlparse(url).netloc
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO frontier VALUES (?, ?, ?, ?, ?, ?)",
+            (url, host, depth, self.priority(url, depth), QUEUED, time.time()),
+        )
+        if cur.rowcount:
+            self.queued[host] = self.queued.get(host, 0) + 1
+        self._tick()
+
+    def pop(self) -> str | None:
+        hosts = [h for h, n in self.queued.items() if n > 0]
+        if not hosts:
+            return None
+        host = min(hosts, key=lambda h: self.served.get(h, 0.0))
+        row = self.conn.execute(
+            "SELECT url, depth FROM frontier WHERE host = ? AND status = ? ORDER BY priority DESC LIMIT 1",
+            (host, QUEUED),
+        ).fetchone()
+        if row is None:
+            self.queued[host] = 0
+            return self.pop()
+        url, depth = row
+        self.conn.execute("UPDATE frontier SET status = ? WHERE url = ?", (INFLIGHT, url))
+        self.queued[host] -= 1
+        self.served[host] = time.monotonic()
+        self.inflight[url] = depth
+        self._tick()
+        return url
+
+    def done(self, url: str) -> None:
+        self.conn.execute("UPDATE frontier SET status = ? WHERE url = ?", (DONE, url))
+        self.inflight.pop(url, None)
+        self._tick()
+
+    def defer(self, url: str) -> None:
+        """Give `url` back for the next run without serving it again in this one."""
+        self.conn.execute("UPDATE frontier SET status = ? WHERE url = ?", (DEFERRED, url))
+        self.inflight.pop(url, None)
+        self._tick()
+
+    def _tick(self) -> None:
+        self._ops += 1
+        if self._ops >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        self.conn.commit()
+        tmp = f"{self.bloom_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.seen.bits)
+        os.replace(tmp, self.bloom_path)
+        self._ops = 0
+
+    def close(self) -> None:
+        self.checkpoint()
+        self.conn.close()
+
     def __len__(self) -> int:
-        return len(self.queue)
\ No newline at end of file
+        return sum(self.queued.values())
@@ -1,16 +1,21 @@
 from __future__ import annotations
+import asyncio
 import os
 from pathlib import Path
 import re
 import time
 import yaml
 import typer
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
 from ..common.io_utils import ensure_dir, sha256_of_bytes, write_gzip_bytes, write_json_gz
 from ..common.robots import allowed
-from .frontier import Frontier
+from .frontier import Frontier, PersistentFrontier
 from .fetch import Fetcher
-from .extract import extract_page_fields, within_allow, matches_deny
+from .extract import extract_page_fields
+from .async_crawl import AsyncCrawler, make_client
+from .state import CrawlState
+from .url_filter import UrlFilter
 
 app = typer.Typer(add_completion=False)
 
@@ -26,21 +31,55 @@ def main(
     out: str = typer.Option("data/raw_html", help="Output dir for raw html"),
     parsed_out: str = typer.Option("data/parsed_json", help="Output dir for parsed json"),
     max_pages: int = typer.Option(200, help="Max pages to fetch"),
-    rps: float = typer.Option(float(os.getenv("RPS", "1.0")), help="Requests per second"),
+    rps: float = typer.Option(float(os.getenv("RPS", "1.0")), help="Requests per second (per host with --engine async)"),
     user_agent: str = typer.Option(os.getenv("HTTP_USER_AGENT", "finra-rag-bot/0.1")),
+    engine: str = typer.Option("async", help="async (concurrent, per-host rate limits) or sync (one URL at a time)"),
+    concurrency: int = typer.Option(int(os.getenv("CRAWL_CONCURRENCY", "16")), help="Max requests in flight"),
+    burst: int = typer.Option(1, help="Per-host token bucket size"),
+    parse_workers: int = typer.Option(os.cpu_count() or 2, help="Processes parsing pages"),
+    state_path: str = typer.Option("data/crawl_state.sqlite3", help="ETag/Last-Modified/sha256 store for conditional recrawls; empty disables"),
+    frontier_path: str = typer.Option("", help="Disk-backed priority frontier; an existing one is resumed (delete it to start over). Empty keeps an in-memory FIFO"),
 ):
     seeds_cfg = load_yaml(seeds)
     allow_patterns: List[str] = seeds_cfg.get("allow", [])
     seed_urls: List[str] = seeds_cfg.get("seeds", [])
 
     deny_patterns: List[str] = load_yaml(blocklist).get("deny", [])
+    url_filter = UrlFilter(allow_patterns, deny_patterns)
     selectors = load_yaml(selectors_path)
 
     ensure_dir(out)
     ensure_dir(parsed_out)
+    state = None
+    if state_path:
+        ensure_dir(Path(state_path).parent)
+        state = CrawlState(state_path)
+    if frontier_path:
+        ensure_dir(Path(frontier_path).parent)
+        fr = PersistentFrontier(frontier_path, seed_urls, weights=seeds_cfg.get("priority"), state=state)
+        print(f"Frontier at {frontier_path}: {len(fr)} URLs queued")
+    else:
+        fr = Frontier(seed_urls)
+
+    if engine == "async":
+        start = time.time()
+        try:
+            stats = asyncio.run(crawl_async(
+                seed_urls, allow_patterns, deny_patterns, selectors, out, parsed_out,
+                user_agent=user_agent, max_pages=max_pages, concurrency=concurrency,
+                rps=rps, burst=burst, parse_workers=parse_workers, state=state, frontier=fr,
+                url_filter=url_filter,
+            ))
+        finally:
+            fr.close()
+            if state is not None:
+                state.close()
+        print(f"Fetched {stats['fetched']} new/changed pages in {time.time() - start:.1f}s → {out} "
+              f"({stats['not_modified']} not modified, {stats['unchanged']} unchanged, "
+              f"{stats['skipped']} skipped, {stats['errors']} errors)")
+        return
 
     fetcher = Fetcher(user_agent=user_agent, rps=rps)
-    fr = Frontier(seed_urls)
 
     fetched = 0
     start = time.time()
@@ -50,39 +89,79 @@ def main(
             url = fr.pop()
             if not url:
                 break
-            if not within_allow(url, allow_patterns):
-                continue
-            if matches_deny(url, deny_patterns):
-                continue
-            if not allowed(url, user_agent):
-                continue
+            finished = False
+            try:
+                if url_filter(url) and allowed(url, user_agent):
+                    counted, finished = crawl_page(url, fr, fetcher, state, selectors, out, parsed_out,
+                                                   url_filter, user_agent)
+                    fetched += counted
+                else:
+                    finished = True
+            finally:
+                # Failed fetches stay in a persistent frontier for the next run
+                if finished:
+                    fr.done(url)
+                else:
+                    fr.defer(url)
+    finally:
+        fetcher.close()
+        fr.close()
+        if state is not None:
+            state.close()
 
-            status, content, headers = fetcher.get(url)
-            if status in (304, 204) or status >= 400:
-                continue
+    dur = time.time() - start
+    print(f"Fetched {fetched} pages in {dur:.1f}s → {out}")
 
-            sha = sha256_of_bytes(content)
+def crawl_page(url, fr, fetcher, state, selectors, out, parsed_out, url_filter, user_agent) -> Tuple[int, bool]:
+    """
+    Fetch one URL for the sync engine and queue its links. Returns (1 if it
+    counts toward max_pages, False if it should be retried on a later run).
+    """
+    prev = state.get(url) if state is not None else None
+    validators = CrawlState.conditional_headers(prev)
+    status, content, headers = fetcher.get(
+        url, etag=validators.get("If-None-Match"), last_modified=validators.get("If-Modified-Since")
+    )
+    if status == 304 and prev is not None:
+        state.touch(url, status)
+        links = prev["links"]
+    elif status >= 500:
+        return 0, False
+    elif status in (304, 204) or status >= 400:
+        return 0, True
+    else:
+        sha = sha256_of_bytes(content)
+        if prev is not None and prev["sha256"] == sha:
+            links = prev["links"]
+        else:
             day = time.strftime("%Y/%m/%d")
             raw_path = Path(out) / day / f"{sha}.html.gz"
             write_gzip_bytes(raw_path, content)
 
             page = extract_page_fields(content.decode("utf-8", errors="ignore"), url, selectors)
             write_json_gz(Path(parsed_out) / f"{sha}.json.gz", page)
+            links = page["links"]
+        if state is not None:
+            state.record(url, status, headers, sha, links, changed=prev is None or prev["sha256"] != sha)
 
-            for link in page["links"]:
-                if matches_deny(link, deny_patterns):
-                    continue
-                if not within_allow(link, allow_patterns):
-                    continue
-                if allowed(link, user_agent):
-                    fr.push(link)
+    for link in links:
+        if not url_filter(link):
+            continue
+        if allowed(link, user_agent):
+            fr.push(link, parent=url)
+    return 1, True
 
-            fetched += 1
-    finally:
-        fetcher.close()
-
-    dur = time.time() - start
-    print(f"Fetched {fetched} pages in {dur:.1f}s → {out}")
+async def crawl_async(seed_urls, allow_patterns, deny_patterns, selectors, out, parsed_out, *,
+                      user_agent, max_pages, concurrency, rps, burst, parse_workers, state=None,
+                      frontier=None, url_filter=None) -> dict:
+    with ProcessPoolExecutor(max_workers=max(parse_workers, 1)) as pool:
+        async with make_client(user_agent, concurrency=concurrency) as client:
+            crawler = AsyncCrawler(
+                client, allow_patterns, deny_patterns, selectors, out, parsed_out, user_agent,
+                max_pages=max_pages, concurrency=concurrency, rps_per_host=rps, burst=burst,
+                parse_executor=pool, state=state, url_filter=url_filter,
+            )
+            return await crawler.run(seed_urls, frontier=frontier)
 
 if __name__ == "__main__":
     app()
@@ -0,0 +1,78 @@
+from __future__ import annotations
+import json
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+
+class CrawlState:
+    """
+    Per-URL validators and content hash from the last fetch, persisted in
+    SQLite so a recrawl can send conditional GETs and skip unchanged pages.
+    Outlinks are kept too, so a 304 still feeds the frontier.
+    """
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, sha256 TEXT, "
+            "status INTEGER, fetched_at REAL, changed_at REAL, links TEXT)"
+        )
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT etag, last_modified, sha256, status, fetched_at, changed_at, links FROM pages WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, sha256, status, fetched_at, changed_at, links = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "sha256": sha256,
+            "status": status,
+            "fetched_at": fetched_at,
+            "changed_at": changed_at,
+            "links": json.loads(links) if links else [],
+        }
+
+    def fetched_at(self, url: str) -> Optional[float]:
+        """When `url` was last fetched; cheap enough to call for every discovered link."""
+        row = self.conn.execute("SELECT fetched_at FROM pages WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def conditional_headers(prev: Optional[Dict]) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        if prev and prev.get("sha256"):
+            if prev.get("etag"):
+                headers["If-None-Match"] = prev["etag"]
+            if prev.get("last_modified"):
+                headers["If-Modified-Since"] = prev["last_modified"]
+        return headers
+
+    def record(self, url: str, status: int, headers: Dict[str, str], sha256: str, links: List[str],
+               changed: bool) -> None:
+        """Store a 200 response; `changed_at` only moves when the content hash changed."""
+        now = time.time()
+        lower = {k.lower(): v for k, v in headers.items()}
+        self.conn.execute(
+            "INSERT INTO pages (url, etag, last_modified, sha256, status, fetched_at, changed_at, links) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+            "sha256 = excluded.sha256, status = excluded.status, fetched_at = excluded.fetched_at, "
+            "changed_at = CASE WHEN ? THEN excluded.changed_at ELSE pages.changed_at END, links = excluded.links",
+            (url, lower.get("etag"), lower.get("last-modified"), sha256, status, now, now, json.dumps(links),
+             changed),
+        )
+        self.conn.commit()
+
+    def touch(self, url: str, status: int) -> None:
+        """Note a fetch that returned no new content (e.g. 304)."""
+        self.conn.execute("UPDATE pages SET status = ?, fetched_at = ? WHERE url = ?", (status, time.time(), url))
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,57 @@
+from __future__ import annotations
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+
+@lru_cache(maxsize=None)
+def compile_pattern(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+# A numbered backreference would point at the wrong group once patterns are joined
+_BACKREF = re.compile(r"(?<!\\)\\[1-9]")
+
+def _combine(patterns: List[str]) -> Optional[re.Pattern]:
+    """One alternation for all patterns (search semantics are preserved per branch)."""
+    if not patterns or any(_BACKREF.search(p) for p in patterns):
+        return None
+    try:
+        return re.compile("|".join(f"(?:{p})" for p in patterns))
+    except re.error:
+        # e.g. inline global flags mid-pattern; fall back to matching pattern by pattern
+        return None
+
+
+class UrlFilter:
+    """
+    Allow/deny verdicts for crawl URLs. Each pattern list is compiled once
+    into a single alternation, and verdicts are cached per URL since the same
+    nav/footer links turn up on nearly every page. A URL is in scope when it
+    matches some allow pattern and no deny pattern.
+    """
+    def __init__(self, allow_patterns: Iterable[str], deny_patterns: Iterable[str] = (), cache_size: int = 200_000):
+        self.allow_patterns = list(allow_patterns)
+        self.deny_patterns = list(deny_patterns)
+        self._allow = _combine(self.allow_patterns)
+        self._deny = _combine(self.deny_patterns)
+        self.cache_size = cache_size
+        self._cache: Dict[str, bool] = {}
+
+    def _matches(self, combined: Optional[re.Pattern], patterns: List[str], url: str) -> bool:
+        if combined is not None:
+            return combined.search(url) is not None
+        return any(compile_pattern(p).search(url) for p in patterns)
+
+    def allowed(self, url: str) -> bool:
+        verdict = self._cache.get(url)
+        if verdict is None:
+            verdict = self._matches(self._allow, self.allow_patterns, url) and \
+                not self._matches(self._deny, self.deny_patterns, url)
+            if self.cache_size:
+                if len(self._cache) >= self.cache_size:
+                    self._cache.clear()
+                self._cache[url] = verdict
+        return verdict
+
+    __call__ = allowed
@@ -2,6 +2,9 @@ from __future__ import annotations
 from typing import Dict, Any, List
 import hashlib
 
+# Bump when h2_chunker's output changes for the same blocks, so run_transform redoes existing chunks
+CHUNKER_VERSION = 1
+
 def _hash_id(parts: List[str]) -> str:
     return hashlib.sha256("::".join(parts).encode("utf-8")).hexdigest()[:16]
 
@@ -1,25 +1,33 @@
 from __future__ import annotations
 from typing import Dict, Any, List
-from bs4 import BeautifulSoup
-from ..common.html_utils import clean_text
+from ..common.html_utils import node_text, parse_html
 
-def html_to_blocks(html: str) -> List[Dict[str, Any]]:
-    """Create a sequence of blocks preserving H2/H3 structure and paragraphs/lists."""
-    soup = BeautifulSoup(html, "lxml")
-    article = soup.select_one("main article") or soup
+# Bump when block extraction changes; stored pages with an older version get their blocks rebuilt
+BLOCKS_VERSION = 2
+
+def tree_to_blocks(root) -> List[Dict[str, Any]]:
+    """Create a sequence of blocks preserving H2/H3 structure and paragraphs/lists from a parsed lxml tree."""
+    found = root.cssselect("main article")
+    article = found[0] if found else root
     blocks: List[Dict[str, Any]] = []
-    for el in article.find_all(["h2", "h3", "p", "ul", "ol"], recursive=True):
-        if el.name == "p":
-            text = clean_text(el.get_text(" ", strip=True))
+    for el in article.iter("h2", "h3", "p", "ul", "ol"):
+        if el is article:
+            continue
+        if el.tag == "p":
+            text = node_text(el)
             if text:
                 blocks.append({"type": "p", "text": text})
-        elif el.name in ("ul", "ol"):
-            items = [clean_text(li.get_text(" ", strip=True)) for li in el.find_all("li", recursive=False)]
+        elif el.tag in ("ul", "ol"):
+            items = [node_text(li) for li in el.findall("li")]
             items = [x for x in items if x]
             if items:
                 blocks.append({"type": "list", "items": items})
         else:  # h2/h3
-            text = clean_text(el.get_text(" ", strip=True))
-            lvl = 2 if el.name == "h2" else 3
+            text = node_text(el)
+            lvl = 2 if el.tag == "h2" else 3
             blocks.append({"type": f"h{lvl}", "text": text})
     return blocks
+
+def html_to_blocks(html: str) -> List[Dict[str, Any]]:
+    """Blocks for a page parsed before extraction stored them (see crawl.extract.extract_page_fields)."""
+    return tree_to_blocks(parse_html(html))
@@ -1,10 +1,14 @@
 from __future__ import annotations
+import json
 from pathlib import Path
 import typer
 import yaml
 from ..common.io_utils import iter_paths, read_json_gz, write_json_gz, ensure_dir
-from .normalize import html_to_blocks
-from .chunkers import h2_chunker
+from .normalize import BLOCKS_VERSION, html_to_blocks
+from .chunkers import CHUNKER_VERSION, h2_chunker
+
+# Which transform settings produced each chunk file; build_jsonl only reads *.json.gz
+MANIFEST = "_transform_manifest.json"
 
 app = typer.Typer(add_completion=False)
 
@@ -14,22 +18,37 @@ def main(
     out: str = typer.Option("data", help="Base output dir (parsed_json, chunks)"),
     selectors: str = typer.Option("config/selectors.yml"),
     routing: str = typer.Option("config/routing.yml"),
+    force: bool = typer.Option(False, help="Re-transform pages whose chunks already exist"),
+    max_chars: int = typer.Option(1800, help="Max characters per chunk"),
 ):
     parsed_dir = Path(out) / "parsed_json"
     chunks_dir = Path(out) / "chunks"
     ensure_dir(chunks_dir)
 
     _ = yaml.safe_load(open(routing, "r", encoding="utf-8"))  # reserved for future routing
-    count = 0
-    for p in iter_paths(parsed_dir, ".json.gz"):
-        page = read_json_gz(p)
-        html = page.get("html", "")
-        page["blocks"] = html_to_blocks(html)
-        chunks = h2_chunker(page, max_chars=1800)
-        out_path = chunks_dir / (p.stem + ".json.gz")
-        write_json_gz(out_path, chunks)
-        count += 1
-    print(f"Transformed {count} pages → {chunks_dir}")
+    version = f"chunker={CHUNKER_VERSION};max_chars={max_chars};blocks={BLOCKS_VERSION}"
+    manifest_path = chunks_dir / MANIFEST
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest_path.exists() else {}
+    count = skipped = 0
+    try:
+        for p in iter_paths(parsed_dir, ".json.gz"):
+            out_path = chunks_dir / (p.stem + ".json.gz")
+            # Parsed pages are named by content sha256, so existing chunks made with the same
+            # settings mean identical output; a settings change redoes them
+            if out_path.exists() and manifest.get(out_path.name) == version and not force:
+                skipped += 1
+                continue
+            page = read_json_gz(p)
+            if page.get("blocks_version") != BLOCKS_VERSION:
+                # Pages crawled before extraction emitted (these) blocks
+                page["blocks"] = html_to_blocks(page.get("html", ""))
+            chunks = h2_chunker(page, max_chars=max_chars)
+            write_json_gz(out_path, chunks)
+            manifest[out_path.name] = version
+            count += 1
+    finally:
+        manifest_path.write_text(json.dumps(manifest, sort_keys=True), encoding="utf-8")
+    print(f"Transformed {count} pages → {chunks_dir} ({skipped} unchanged skipped)")
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -0,0 +1,57 @@
+"""Single-pass lxml extraction must match the BeautifulSoup output it replaced: python -m pytest tests
+
+fixtures/finra_page.expected.json was generated from fixtures/finra_page.html with the
+BeautifulSoup extract_page_fields / html_to_blocks that preceded the lxml rewrite.
+"""
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from src.crawl.extract import extract_page_fields
+from src.transform.normalize import html_to_blocks
+
+HERE = Path(__file__).resolve().parent
+CONFIG = HERE.parent / "config"
+FIXTURES = HERE / "fixtures"
+URL = "https://www.finra.org/investors/learn-to-invest/saving-for-retirement"
+
+
+@pytest.fixture(scope="module")
+def selectors():
+    return yaml.safe_load((CONFIG / "selectors.yml").read_text(encoding="utf-8"))
+
+
+@pytest.fixture(scope="module")
+def page(selectors):
+    html = (FIXTURES / "finra_page.html").read_text(encoding="utf-8")
+    return extract_page_fields(html, URL, selectors)
+
+
+@pytest.fixture(scope="module")
+def expected():
+    return json.loads((FIXTURES / "finra_page.expected.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("field", ["url", "title", "publish_date", "breadcrumbs", "links", "blocks"])
+def test_fields_match_previous_output(page, expected, field):
+    assert page[field] == expected[field]
+
+
+def test_standalone_block_parser_matches(page, expected):
+    # run_transform reparses stored html with html_to_blocks when the blocks version is stale
+    assert html_to_blocks(page["html"]) == expected["blocks"]
+
+
+@pytest.mark.parametrize("html, title, publish_date", [
+    ("", "", None),
+    ("<html><body><p>no heading</p></body></html>", "", None),
+    ("<h1>Plain  <b>title</b></h1><span class='published-date'> 01/02/2023 </span>", "Plain title", "01/02/2023"),
+])
+def test_minimal_pages(selectors, html, title, publish_date):
+    page = extract_page_fields(html, URL, selectors)
+    assert page["title"] == title
+    assert page["publish_date"] == publish_date
+    assert page["breadcrumbs"] == []
+    assert page["links"] == []
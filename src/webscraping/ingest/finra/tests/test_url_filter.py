@@ -0,0 +1,55 @@
+"""UrlFilter must agree with matching the allow/deny patterns one by one: python -m pytest tests"""
+import re
+from pathlib import Path
+
+import pytest
+import yaml
+
+from src.crawl.url_filter import UrlFilter
+
+CONFIG = Path(__file__).resolve().parents[1] / "config"
+
+
+def per_pattern(url, allow, deny):
+    # The matcher UrlFilter replaced
+    return any(re.compile(p).search(url) for p in allow) and not any(re.compile(p).search(url) for p in deny)
+
+
+def sample_urls(seeds):
+    urls = list(seeds)
+    for seed in seeds:
+        urls += [
+            seed + "/", seed + "/topic", seed + "x", seed + "-old/page", seed + "/a?b=1", seed + "/file.zip",
+            seed + "/search/results", seed.replace("https://", "http://"), seed.replace("www.", "m."),
+        ]
+    urls += [
+        "https://www.finra.org/investors", "https://www.finra.org/investors/learn-to-invest/login",
+        "https://www.finra.org/arbitration/x", "https://twitter.com/finra", "", "https://www.finra.org/investors/",
+    ]
+    return urls
+
+
+def test_config_patterns_match_per_pattern_loop():
+    allowlist = yaml.safe_load((CONFIG / "crawl_allowlist.yml").read_text())
+    deny = yaml.safe_load((CONFIG / "crawl_blocklist.yml").read_text())["deny"]
+    url_filter = UrlFilter(allowlist["allow"], deny)
+    for url in sample_urls(allowlist["seeds"]):
+        assert url_filter(url) == per_pattern(url, allowlist["allow"], deny), url
+        assert url_filter(url) == per_pattern(url, allowlist["allow"], deny), url  # cached verdict
+
+
+@pytest.mark.parametrize("allow, deny", [
+    # anchors and capture groups in separate branches
+    ([r"^https://a\.test/(x|y)($|/.*)", r"b\.test/z$"], [r"(\?|#)", r"\.pdf$"]),
+    # numbered backreference (would shift groups if joined) and a global inline flag (cannot be joined)
+    ([r"^https://a\.test/(x)", r"/(\w+)/\1/"], [r"(?i)PRIVATE"]),
+    # empty lists
+    ([], []),
+])
+def test_tricky_patterns_match_per_pattern_loop(allow, deny):
+    urls = ["https://a.test/x", "https://a.test/x/1", "https://a.test/xy", "https://b.test/z", "https://b.test/z/",
+            "https://a.test/y?q", "https://a.test/y/doc.pdf", "https://c.test/ab/ab/", "https://c.test/ab/cd/",
+            "https://c.test/ab/ab/Private"]
+    url_filter = UrlFilter(allow, deny)
+    for url in urls:
+        assert url_filter(url) == per_pattern(url, allow, deny), url
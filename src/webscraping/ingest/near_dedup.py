@@ -0,0 +1,321 @@
+"""Corpus-wide near-duplicate detection for normalized NDJSON records.
+
+Runs between normalization and embedding. The IRS and consumer-finance
+normalizers only drop exact duplicate chunks within one document, so shared
+boilerplate (navigation text, disclaimers, repeated FAQ answers) is embedded
+once per page. This stage MinHashes word shingles of every record, finds
+candidate pairs with LSH banding, confirms them by signature agreement and
+collapses each cluster onto one canonical record.
+
+Write the output under its own prefix (or bucket), outside the input, and
+set the embedder's INGEST_PREFIX to it; otherwise the embedder also reads
+the undeduplicated input and every record is embedded twice.
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingle_hashes(text: str, size: int = 5) -> np.ndarray:
+    """32-bit hashes of the word `size`-grams of `text` (whole text if shorter)."""
+    tokens = TOKEN_RE.findall(text.lower())
+    if len(tokens) < size:
+        grams = {" ".join(tokens)} if tokens else set()
+    else:
+        grams = {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") for g in grams),
+        dtype=np.uint64,
+        count=len(grams),
+    )
+
+
+class MinHasher:
+    """MinHash signatures from universal hashes (a * x + b) mod p over shingle hashes."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        if not len(hashes):
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        # uint64 products wrap; as in common MinHash implementations this only perturbs the permutation
+        permuted = (hashes[:, None] * self.a + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+
+
+class _UnionFind:
+    def __init__(self, size: int) -> None:
+        self.parent = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, left: int, right: int) -> None:
+        left, right = self.find(left), self.find(right)
+        if left != right:
+            self.parent[max(left, right)] = min(left, right)
+
+
+@dataclass
+class DedupResult:
+    keep: list[int]
+    # canonical record index -> indices of the records collapsed onto it
+    clusters: dict[int, list[int]] = field(default_factory=dict)
+    # (canonical, duplicate) -> estimated Jaccard similarity
+    similarity: dict[tuple[int, int], float] = field(default_factory=dict)
+
+
+def find_near_duplicates(texts: list[str], *, threshold: float = 0.8, num_perm: int = 128,
+                         bands: int = 16, shingle_size: int = 5, seed: int = 1) -> DedupResult:
+    """Cluster texts whose estimated Jaccard similarity reaches `threshold`.
+
+    LSH banding with `bands` bands of num_perm / bands rows proposes candidate
+    pairs; a pair is merged only if its full signatures agree on at least
+    `threshold` of their positions. The longest text of each cluster (earliest
+    on ties) is kept as the canonical record.
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands")
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm, seed)
+    signatures = np.stack([hasher.signature(shingle_hashes(t, shingle_size)) for t in texts]) if texts else \
+        np.zeros((0, num_perm), dtype=np.uint64)
+
+    union = _UnionFind(len(texts))
+    for band in range(bands):
+        buckets: dict[bytes, list[int]] = {}
+        for idx, key in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(key.tobytes(), []).append(idx)
+        for members in buckets.values():
+            # Each member is compared against one representative per cluster already
+            # seen in the bucket, so a bucket of near-identical boilerplate costs O(m)
+            reps: dict[int, int] = {}
+            for member in members:
+                root = union.find(member)
+                if root in reps:
+                    continue
+                if reps:
+                    candidates = list(reps.values())
+                    agreement = (signatures[candidates] == signatures[member]).mean(axis=1)
+                    matched = [rep for rep, score in zip(candidates, agreement) if score >= threshold]
+                    if matched:
+                        for rep in matched:
+                            union.union(member, rep)
+                        reps = {union.find(rep): rep for rep in candidates}
+                        continue
+                reps[root] = member
+
+    groups: dict[int, list[int]] = {}
+    for idx in range(len(texts)):
+        groups.setdefault(union.find(idx), []).append(idx)
+
+    result = DedupResult(keep=[])
+    for members in groups.values():
+        canonical = max(members, key=lambda i: (len(texts[i]), -i))
+        result.keep.append(canonical)
+        duplicates = [i for i in members if i != canonical]
+        if duplicates:
+            result.clusters[canonical] = duplicates
+            agreement = (signatures[duplicates] == signatures[canonical]).mean(axis=1)
+            for dup, score in zip(duplicates, agreement):
+                result.similarity[(canonical, dup)] = float(score)
+    result.keep.sort()
+    return result
+
+
+def _split_gcs(uri: str) -> tuple[str, str]:
+    bucket, _, prefix = uri[len("gs://"):].partition("/")
+    return bucket, prefix
+
+
+RECORD_SUFFIXES = (".ndjson", ".jsonl.gz")
+
+
+def _parse_lines(name: str, data: bytes) -> Iterator[dict]:
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+    for line in data.decode("utf-8").splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_ndjson(source: str) -> Iterator[tuple[str, dict]]:
+    """Yield (relative path, record) for every .ndjson / .jsonl.gz file under a local dir or gs:// prefix."""
+    if source.startswith("gs://"):
+        from google.cloud import storage
+
+        bucket_name, prefix = _split_gcs(source)
+        for blob in storage.Client().list_blobs(bucket_name, prefix=prefix):
+            if not blob.name.endswith(RECORD_SUFFIXES):
+                continue
+            relative = blob.name[len(prefix):].lstrip("/")
+            for record in _parse_lines(blob.name, blob.download_as_bytes()):
+                yield relative, record
+        return
+    root = Path(source)
+    paths = sorted(p for p in root.rglob("*") if p.is_file() and p.name.endswith(RECORD_SUFFIXES))
+    for path in paths:
+        relative = path.relative_to(root).as_posix()
+        for record in _parse_lines(path.name, path.read_bytes()):
+            yield relative, record
+
+
+def _serialize(relative: str, records: list[dict]) -> bytes:
+    """Records as JSON lines, gzipped if the source file was (so .jsonl.gz stays .jsonl.gz)."""
+    data = "\n".join(json.dumps(record, ensure_ascii=False) for record in records).encode("utf-8")
+    return gzip.compress(data) if relative.endswith(".gz") else data
+
+
+def write_ndjson(destination: str, files: dict[str, list[dict]]) -> None:
+    if destination.startswith("gs://"):
+        from google.cloud import storage
+
+        bucket_name, prefix = _split_gcs(destination)
+        bucket = storage.Client().bucket(bucket_name)
+        for relative, records in files.items():
+            blob = bucket.blob(f"{prefix.rstrip('/')}/{relative}" if prefix else relative)
+            content_type = "application/gzip" if relative.endswith(".gz") else "application/x-ndjson"
+            blob.upload_from_string(_serialize(relative, records), content_type=content_type)
+        return
+    root = Path(destination)
+    for relative, records in files.items():
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(_serialize(relative, records))
+
+
+def _overlaps(left: str, right: str) -> bool:
+    """True if one location contains the other (an empty gs:// prefix covers the whole bucket)."""
+    left, right = left.rstrip("/") + "/", right.rstrip("/") + "/"
+    if not left.startswith("gs://"):
+        left, right = str(Path(left).resolve()) + "/", str(Path(right).resolve()) + "/"
+    return left.startswith(right) or right.startswith(left)
+
+
+def dedup_records(records: list[tuple[str, dict]], *, action: str = "collapse", threshold: float = 0.8,
+                  num_perm: int = 128, bands: int = 16, shingle_size: int = 5,
+                  max_report_clusters: int = 200) -> tuple[dict[str, list[dict]], dict]:
+    """Drop near-duplicates and return (records grouped by file, report).
+
+    With action="collapse" the canonical record also lists the ids and source
+    URLs of the records collapsed onto it.
+    """
+    texts = [record.get("text") or record.get("content") or "" for _, record in records]
+    result = find_near_duplicates(texts, threshold=threshold, num_perm=num_perm, bands=bands,
+                                  shingle_size=shingle_size)
+
+    if action == "collapse":
+        for canonical, duplicates in result.clusters.items():
+            record = records[canonical][1]
+            record["duplicate_ids"] = [records[i][1].get("id") for i in duplicates]
+            record["duplicate_urls"] = sorted(
+                {records[i][1].get("source_url") for i in duplicates} - {record.get("source_url"), None}
+            )
+
+    files: dict[str, list[dict]] = {}
+    for idx in result.keep:
+        relative, record = records[idx]
+        files.setdefault(relative, []).append(record)
+
+    dropped_by_authority = Counter(
+        records[i][1].get("authority") or "N/A" for dups in result.clusters.values() for i in dups
+    )
+    largest = sorted(result.clusters.items(), key=lambda item: len(item[1]), reverse=True)
+    report = {
+        "records_in": len(records),
+        "records_out": len(result.keep),
+        "dropped": len(records) - len(result.keep),
+        "clusters": len(result.clusters),
+        "files_in": len({relative for relative, _ in records}),
+        "files_out": len(files),
+        "dropped_by_authority": dict(dropped_by_authority),
+        "params": {"action": action, "threshold": threshold, "num_perm": num_perm, "bands": bands,
+                   "shingle_size": shingle_size},
+        "largest_clusters": [
+            {
+                "canonical_id": records[canonical][1].get("id"),
+                "canonical_url": records[canonical][1].get("source_url"),
+                "size": len(duplicates) + 1,
+                "preview": texts[canonical][:160],
+                "duplicates": [
+                    {
+                        "id": records[i][1].get("id"),
+                        "source_url": records[i][1].get("source_url"),
+                        "similarity": round(result.similarity[(canonical, i)], 3),
+                    }
+                    for i in duplicates
+                ],
+            }
+            for canonical, duplicates in largest[:max_report_clusters]
+        ],
+    }
+    return files, report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Drop corpus-wide near-duplicate records before embedding")
+    parser.add_argument("--input", required=True,
+                        help="Local directory or gs://bucket/prefix of .ndjson / .jsonl.gz records")
+    parser.add_argument("--output", required=True,
+                        help="Local directory or gs://bucket/prefix for deduped records; must not overlap --input")
+    parser.add_argument("--report", type=Path, default=Path("data/dedup_report.json"), help="Where to write the report")
+    parser.add_argument("--action", choices=("drop", "collapse"), default="collapse",
+                        help="Drop duplicates, or also record them on the canonical record")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity to merge at")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash signature length")
+    parser.add_argument("--bands", type=int, default=16, help="LSH bands; num-perm must be divisible by it")
+    parser.add_argument("--shingle-size", type=int, default=5, help="Words per shingle")
+    parser.add_argument("--log-level", type=str, default="INFO", help="Logging verbosity")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO))
+    if _overlaps(args.input, args.output):
+        raise SystemExit("--output must be outside --input, or the next run (and the embedder) reads both")
+    records = list(read_ndjson(args.input))
+    LOGGER.info("Loaded %d records from %s", len(records), args.input)
+    files, report = dedup_records(
+        records,
+        action=args.action,
+        threshold=args.threshold,
+        num_perm=args.num_perm,
+        bands=args.bands,
+        shingle_size=args.shingle_size,
+    )
+    write_ndjson(args.output, files)
+    args.report.parent.mkdir(parents=True, exist_ok=True)
+    args.report.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    LOGGER.info(
+        "Kept %d of %d records (%d clusters); report at %s",
+        report["records_out"], report["records_in"], report["clusters"], args.report,
+    )
+
+
+if __name__ == "__main__":
+    main()
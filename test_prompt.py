@@ -6,9 +6,15 @@ logging.basicConfig(level=logging.INFO)
 
 # These URLs should match the Docker Compose service ports
 RETRIEVER_URL = os.environ.get("RETRIEVER_URL", "http://localhost:8000/retrieve")
+RETRIEVER_BATCH_URL = os.environ.get("RETRIEVER_BATCH_URL", "http://localhost:8000/retrieve/batch")
 LLM_URL = os.environ.get("LLM_URL", "http://localhost:8001/query")
 
 user_query = "Explain how inflation affects stock prices."
+batch_queries = [
+    user_query,
+    "What is the difference between a Roth IRA and a traditional IRA?",
+    "What does Box 12 code DD on Form W-2 mean?",
+]
 
 def test_retriever(query: str):
     logging.info("Testing Retriever Service")
@@ -25,6 +31,22 @@ def test_retriever(query: str):
         logging.error(f"Unexpected error in Retriever test: {e}")
 
 
+def test_retriever_batch(queries: list[str]):
+    logging.info("Testing Retriever Batch Endpoint")
+    payload = {"queries": [{"user_query": q, "top_k": 5} for q in queries]}
+    try:
+        response = requests.post(RETRIEVER_BATCH_URL, json=payload)
+        response.raise_for_status()
+        results = response.json().get("results", [])
+        for result in results:
+            logging.info(f"{result['user_query']!r} -> ids {result['ids']}")
+        return results
+    except requests.HTTPError as e:
+        logging.error(f"Retriever Batch Request failed: {e}")
+    except Exception as e:
+        logging.error(f"Unexpected error in Retriever batch test: {e}")
+
+
 def test_llm(query: str):
     logging.info("Testing LLM Service...")
     payload = {"query": query, "top_k": 5}  # top_k is optional if LLM needs it
@@ -43,4 +65,5 @@ def test_llm(query: str):
 if __name__ == "__main__":
     logging.info(f"Input Query: {user_query}")
     context = test_retriever(user_query)
+    batch_results = test_retriever_batch(batch_queries)
     answer = test_llm(user_query)